@@ -4,7 +4,24 @@
 # Assignment: 5 AVL Tree Implementation
 # Due Date: 16 November 2021
 # Description: AVL tree implementation
+import asyncio
+import mmap
+import os
 import random
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 
 class Stack:
@@ -92,633 +109,3408 @@ class TreeNode:
         return 'AVL Node: {}'.format(self.value)
 
 
+# Marks an omitted default argument
+_MISSING = object()
+
+# Which merge outcomes each set operation keeps: values only in the left
+# tree, values in both, values only in the right tree
+_SET_OPERATIONS = {
+    'union': (True, True, True),
+    'intersection': (False, True, False),
+    'difference': (True, False, False),
+    'symmetric_difference': (True, False, True),
+}
+
+# Counters reported by AVL.cache_info()
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
+class AVLStats:
+    """
+    Operation counters filled in by AVL.enable_stats(), with callback hooks.
+    on_rotate(direction, node) runs on every rotation ('left' or 'right')
+    and on_op_complete(name, counts) after every public operation with the
+    counters that operation added
+    """
+
+    # Counters tracked per tree and per operation
+    FIELDS = ('comparisons', 'single_rotations', 'double_rotations', 'retraced', 'allocations')
+
+    def __init__(self, on_rotate=None, on_op_complete=None) -> None:
+        """
+        Initialize zeroed counters
+        """
+        self.comparisons = 0
+        self.single_rotations = 0
+        self.double_rotations = 0
+        self.retraced = 0
+        self.allocations = 0
+        # Operation name -> number of calls
+        self.operations = {}
+        self.on_rotate = [] if on_rotate is None else [on_rotate]
+        self.on_op_complete = [] if on_op_complete is None else [on_op_complete]
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current counters as a dict
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def reset(self) -> None:
+        """
+        Zeroes every counter (hooks are kept)
+        """
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.operations = {}
+
+    def __str__(self):
+        counts = ", ".join('{}={}'.format(field, getattr(self, field)) for field in self.FIELDS)
+        return "AVLStats { " + counts + " }"
+
+
+class _CountedProbe:
+    """
+    Wraps the value a descent searches for so that every comparison with a
+    stored value is counted in an AVLStats (see AVL.enable_stats)
+    """
+
+    __slots__ = ('value', 'stats')
+
+    def __init__(self, value, stats) -> None:
+        self.value = value
+        self.stats = stats
+
+    def __lt__(self, other) -> bool:
+        # probe < stored
+        self.stats.comparisons += 1
+        return self.value < other
+
+    def __gt__(self, other) -> bool:
+        # stored < probe, reached when the stored value returns NotImplemented
+        self.stats.comparisons += 1
+        return other < self.value
+
+    def __getattr__(self, name):
+        # Comparison methods that read attributes of their operand still work
+        return getattr(self.value, name)
+
+
+class CompactTreeNode:
+    """
+    AVL Tree Node with __slots__ instead of a per-instance __dict__, used by
+    AVL(compact=True). Same fields as TreeNode plus the optional subtree size.
+
+    Approximate memory per key on 64-bit CPython 3.11, not counting the key
+    object itself (measured with tracemalloc over 10**6 nodes):
+        TreeNode (default)    112 bytes
+        CompactTreeNode        80 bytes
+    """
+
+    __slots__ = ('value', 'left', 'right', 'parent', 'height', 'size')
+
+    def __init__(self, value: object) -> None:
+        """
+        Initialize a new AVL node
+        """
+        self.value = value
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.height = 0
+
+    def __str__(self):
+        return 'AVL Node: {}'.format(self.value)
+
+
+class CompactMapNode(CompactTreeNode):
+    """
+    CompactTreeNode with a payload slot, used by AVLMap(compact=True) and
+    keyed AVL(compact=True) (about 8 bytes per key more than CompactTreeNode)
+    """
+
+    __slots__ = ('data',)
+
+
+class CompactCountNode(CompactMapNode):
+    """
+    CompactMapNode with an occurrence count, used by AVL(multiset=True,
+    compact=True)
+    """
+
+    __slots__ = ('count',)
+
+
 class AVL:
-    def __init__(self, start_tree=None) -> None:
+    # Weight of incremental updates against a rebuild in prefer_rebuild();
+    # measured crossover is near one batch key per ten tree keys at 2 * 10**5
+    BULK_REBUILD_FACTOR = 0.5
+
+    def __init__(self, start_tree=None, order_stats=False, compact=False, cache_size=0,
+                 key=None, reverse=False, multiset=False) -> None:
         """
-        Initialize a new AVL tree
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Initialize a new AVL tree. With order_stats=True every node also
+        keeps its subtree size, enabling rank(), select() and count_range().
+        With compact=True nodes are CompactTreeNode instead of TreeNode.
+        With cache_size > 0 contains() answers repeated lookups from an LRU
+        cache of that many results.
+        With key (a function of one value) values are ordered by key(value),
+        computed once when a value is added and stored in node.value while
+        the value itself goes to node.data. Values passed to lookups and
+        range queries are keyed the same way.
+        With reverse=True the tree is ordered descending: keys are still
+        stored ascending and compared with plain <, and every ordered query
+        (iteration, min/max, floor/ceiling, rank/select, ranges, split and
+        join) is answered mirrored.
+        With multiset=True every node keeps a count of equal values: add()
+        and remove() change it, len() is the total and iteration repeats
+        each value count times. Multisets cannot take a key, since records
+        with equal keys would collapse into the first one added (ValueError)
         """
+        if multiset and key is not None:
+            raise ValueError("multiset trees cannot order values by key")
         self.root = None
+        # Number of values in the tree
+        self._count = 0
+        # Whether nodes carry a subtree size
+        self.order_stats = order_stats
+        # Cached nodes holding the smallest and largest values
+        self.min_node = None
+        self.max_node = None
+        # Sorted copy of the values for batch lookups, dropped on change
+        self._flat = None
+        # Node storage backend
+        self.compact = compact
+        self.node_class = CompactTreeNode if compact else TreeNode
+        # Sort key function (None compares values directly)
+        self.key = key
+        self.key_of = key
+        # Whether the public order is descending (storage stays ascending)
+        self.reverse = reverse
+        if self.key_of is not None and compact:
+            self.node_class = CompactMapNode
+        # Whether equal values are counted on one node
+        self.multiset = multiset
+        if multiset and compact:
+            self.node_class = CompactCountNode
+        # LRU cache of contains() results: value -> present
+        self.cache_size = cache_size
+        self._cache = OrderedDict() if cache_size > 0 else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Operation counters, see enable_stats()
+        self.stats = None
+        # Lowest node changed by the last add or remove, for verify('path')
+        self.last_touched = None
         # populate AVL with initial values (if provided)
         # before using this feature, implement add() method
         if start_tree is not None:
             for value in start_tree:
                 self.add(value)
 
-    def __str__(self) -> str:
+    @classmethod
+    def from_sorted(cls, values, **options) -> 'AVL':
+        """
+        Builds a perfectly balanced AVL from strictly increasing values
+        (decreasing for reverse trees) in linear time. Raises ValueError if
+        they are out of order.
+        Keyword options are passed to the constructor
+        """
+        tree = cls(**options)
+        tree.load_sorted(values)
+        return tree
+
+    @classmethod
+    def from_iterable(cls, values, **options) -> 'AVL':
+        """
+        Builds a perfectly balanced AVL from values in any order, dropping
+        duplicates (counting them for multisets). Keyword options are passed
+        to the constructor
+        """
+        tree = cls(**options)
+        if tree.key_of is None and not tree.multiset:
+            tree.load_sorted(sorted(set(values), reverse=tree.reverse), check=False)
+            return tree
+        # Keyed values may be unhashable and multisets keep repeats, so
+        # sort everything and collapse runs of equal keys
+        tree.load_nodes(tree.nodes_from_sorted(*tree.sort_by_key(values)))
+        return tree
+
+    def load_sorted(self, values, check=True) -> None:
+        """
+        Replaces the content of the tree with strictly increasing values
+        (non-decreasing for multisets, and the other way round for reverse
+        trees), building it bottom-up in linear time
+        """
+        # Need random access to pick middles
+        if not isinstance(values, list):
+            values = list(values)
+        # Nodes are stored ascending whatever the public order
+        if self.reverse:
+            values = values[::-1]
+        key_of = self.key_of
+        keys = values if key_of is None else [key_of(value) for value in values]
+        # Reject input that would break BST ordering
+        if check and self.multiset:
+            for i in range(1, len(keys)):
+                if keys[i] < keys[i - 1]:
+                    raise ValueError("values must be in increasing order")
+        elif check:
+            for i in range(1, len(keys)):
+                if not keys[i - 1] < keys[i]:
+                    raise ValueError("values must be strictly increasing")
+        if self.multiset:
+            self.load_nodes(self.nodes_from_sorted(values, keys))
+        elif key_of is None:
+            self.load_nodes([self.make_node(value) for value in values])
+        else:
+            self.load_nodes([self.make_keyed_node(k, value) for k, value in zip(keys, values)])
+
+    def load_nodes(self, nodes) -> None:
+        """
+        Replaces the content of the tree with nodes (a list in increasing
+        value order), relinking them into a perfectly balanced tree
+        """
+        self.root = self.build_balanced(nodes, 0, len(nodes))
+        if self.root is not None:
+            self.root.parent = None
+        self._count = sum(node.count for node in nodes) if self.multiset else len(nodes)
+        self._flat = None
+        self.cache_clear()
+        self.last_touched = None
+        self.min_node = nodes[0] if nodes else None
+        self.max_node = nodes[-1] if nodes else None
+
+    def build_balanced(self, nodes, lo, hi):
+        """
+        Links nodes[lo:hi] into a balanced subtree and returns its root.
+        Heights and child parent links are set; the caller links the root
+        """
+        # Empty range
+        if lo >= hi:
+            return None
+        # Middle node becomes the subtree root
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        # Build both halves and link them back to node
+        node.left = self.build_balanced(nodes, lo, mid)
+        if node.left is not None:
+            node.left.parent = node
+        node.right = self.build_balanced(nodes, mid + 1, hi)
+        if node.right is not None:
+            node.right.parent = node
+        # Children are complete so stored heights are exact
+        self.update_node(node)
+        return node
+
+    def make_node(self, value):
+        """
+        Creates a detached node for value
+        """
+        node = self.node_class(value)
+        if self.multiset:
+            node.count = 1
+        # A lone node is its own subtree
+        if self.order_stats:
+            node.size = 1
+        return node
+
+    def make_keyed_node(self, key, value):
+        """
+        Creates a detached node ordered by key that holds value
+        """
+        node = self.make_node(key)
+        node.data = value
+        return node
+
+    def nodes_from_sorted(self, values, keys):
+        """
+        Returns nodes for values in ascending key order. A run of equal keys
+        becomes one node holding the first of its values, with the run
+        length as its count in multiset trees
+        """
+        nodes = []
+        keyed = self.key_of is not None
+        for i in range(len(values)):
+            if nodes and not nodes[-1].value < keys[i]:
+                if self.multiset:
+                    nodes[-1].count += 1
+                continue
+            nodes.append(self.make_keyed_node(keys[i], values[i]) if keyed else self.make_node(keys[i]))
+        return nodes
+
+    def sort_by_key(self, values):
+        """
+        Returns (values, keys) as lists in ascending key order, calling the
+        key function once per value
+        """
+        values = list(values)
+        key_of = self.key_of
+        if key_of is None:
+            values.sort()
+            return values, values
+        keys = [key_of(value) for value in values]
+        order = sorted(range(len(values)), key=keys.__getitem__)
+        return [values[i] for i in order], [keys[i] for i in order]
+
+    def key_for(self, value):
+        """
+        Returns the sort key stored for value
+        """
+        return value if self.key_of is None else self.key_of(value)
+
+    def node_item(self, node):
+        """
+        Returns the value held by node (None for None)
+        """
+        if node is None:
+            return None
+        return node.value if self.key_of is None else node.data
+
+    def _require_plain_values(self):
+        """
+        Raises RuntimeError if the tree orders values through a key function
+        or counts repeated values
+        """
+        if self.key_of is not None or self.reverse or self.multiset:
+            raise RuntimeError("not supported for trees with key, reverse or multiset")
+
+    def __len__(self) -> int:
+        """
+        Returns the number of values in the tree
+        """
+        # Count is unknown after a split without order statistics
+        if self._count is None:
+            if self.multiset:
+                self._count = sum(node.count for node in self.ascending_nodes())
+            else:
+                self._count = sum(1 for _ in self.ascending_nodes())
+        return self._count
+
+    def spawn(self) -> 'AVL':
+        """
+        Returns a new empty tree with the same configuration
+        """
+        options = {'order_stats': self.order_stats, 'compact': self.compact,
+                   'cache_size': self.cache_size}
+        # Only plain trees accept key options (AVLMap orders by its keys)
+        if self.key_of is not None:
+            options['key'] = self.key
+        if self.reverse:
+            options['reverse'] = True
+        if self.multiset:
+            options['multiset'] = True
+        return type(self)(**options)
+
+    def adopt_root(self, root) -> None:
+        """
+        Makes root (a detached subtree root or None) the whole tree
+        """
+        self.root = root
+        if root is not None:
+            root.parent = None
+        self._flat = None
+        self.cache_clear()
+        self.last_touched = None
+        self.reset_extremes()
+        if root is None:
+            self._count = 0
+        elif self.order_stats:
+            self._count = root.size
+        else:
+            self._count = None
+
+    def __str__(self) -> str:
+        """
+        Return content of AVL in human-readable form using pre-order traversal
+        DO NOT CHANGE THIS METHOD IN ANY WAY
+        """
+        values = []
+        self._str_helper(self.root, values)
+        return "AVL pre-order { " + ", ".join(values) + " }"
+
+    def _str_helper(self, cur, values):
+        """
+        Helper method for __str__. Does pre-order traversal
+        DO NOT CHANGE THIS METHOD IN ANY WAY
+        """
+        if cur:
+            values.append(str(cur.value))
+            self._str_helper(cur.left, values)
+            self._str_helper(cur.right, values)
+
+    def is_valid_avl(self) -> bool:
+        """
+        Perform pre-order traversal of the tree. Return False if there
+        are any problems with attributes of any of the nodes in the tree.
+        This is intended to be a troubleshooting 'helper' method to help
+        find any inconsistencies in the tree after the add() or remove()
+        operations. Review the code to understand what this method is
+        checking and how it determines whether the AVL tree is correct.
+        DO NOT CHANGE THIS METHOD IN ANY WAY
+        """
+        s = Stack()
+        s.push(self.root)
+        while not s.is_empty():
+            node = s.pop()
+            if node:
+                # check for correct height (relative to children)
+                l = node.left.height if node.left else -1
+                r = node.right.height if node.right else -1
+                if node.height != 1 + max(l, r):
+                    return False
+                if node.parent:
+                    # parent and child pointers are in sync
+                    if node.value < node.parent.value:
+                        check_node = node.parent.left
+                    else:
+                        check_node = node.parent.right
+                    if check_node != node:
+                        return False
+                else:
+                    # NULL parent is only allowed on the root of the tree
+                    if node != self.root:
+                        return False
+                s.push(node.right)
+                s.push(node.left)
+        return True
+
+    def verify(self, level='full') -> bool:
+        """
+        Returns True if find_problems(level) finds nothing
+        """
+        return not self.find_problems(level)
+
+    def find_problems(self, level='full'):
+        """
+        Checks the tree invariants and returns a list of problem
+        descriptions (empty when valid). Levels:
+            'fast'  O(1): root, cached extremes and size bookkeeping
+            'path'  O(log n): every node from the one last changed by add or
+                    remove up to the root, plus the 'fast' checks
+            'full'  O(n): heights, balance factors, parent links, subtree
+                    sizes and global value ordering of every node
+        """
+        if level not in ('fast', 'path', 'full'):
+            raise ValueError("level must be 'fast', 'path' or 'full'")
+        problems = self._check_fast()
+        if level == 'path':
+            node = self.last_touched
+            top = None
+            while node is not None:
+                problems.extend(self._check_node(node))
+                top = node
+                node = node.parent
+            if top is not None and top is not self.root:
+                problems.append("last changed node is not connected to the root")
+        elif level == 'full':
+            problems.extend(self._check_full())
+        return problems
+
+    def _check_fast(self):
+        """
+        Constant-time checks of the root and cached bookkeeping
+        """
+        problems = []
+        root = self.root
+        if root is None:
+            if self.min_node is not None or self.max_node is not None:
+                problems.append("empty tree has cached extremes")
+            if self._count not in (0, None):
+                problems.append("empty tree has count {}".format(self._count))
+            return problems
+        if root.parent is not None:
+            problems.append("root has a parent")
+        problems.extend(self._check_node(root))
+        if self.min_node is None or self.min_node.left is not None:
+            problems.append("cached minimum is missing or has a left child")
+        if self.max_node is None or self.max_node.right is not None:
+            problems.append("cached maximum is missing or has a right child")
+        if self.order_stats and self._count is not None and root.size != self._count:
+            problems.append("root size {} != count {}".format(root.size, self._count))
+        return problems
+
+    def _check_node(self, node):
+        """
+        Checks one node against its children: stored height and size,
+        balance factor, child parent links and local ordering
+        """
+        problems = []
+        left = node.left
+        right = node.right
+        left_height = left.height if left is not None else -1
+        right_height = right.height if right is not None else -1
+        if node.height != 1 + max(left_height, right_height):
+            problems.append("node {} has height {}, expected {}".format(
+                node.value, node.height, 1 + max(left_height, right_height)))
+        if abs(right_height - left_height) > 1:
+            problems.append("node {} has balance factor {}".format(node.value, right_height - left_height))
+        if left is not None:
+            if left.parent is not node:
+                problems.append("left child of {} has a wrong parent".format(node.value))
+            if not left.value < node.value:
+                problems.append("left child of {} is not smaller".format(node.value))
+        if right is not None:
+            if right.parent is not node:
+                problems.append("right child of {} has a wrong parent".format(node.value))
+            if not node.value < right.value:
+                problems.append("right child of {} is not larger".format(node.value))
+        weight = 1
+        if self.multiset:
+            weight = node.count
+            if weight < 1:
+                problems.append("node {} has count {}".format(node.value, weight))
+        if self.order_stats:
+            expected = weight + (left.size if left is not None else 0) + (right.size if right is not None else 0)
+            if node.size != expected:
+                problems.append("node {} has size {}, expected {}".format(node.value, node.size, expected))
+        return problems
+
+    def _check_full(self):
+        """
+        Checks every node, carrying the open value interval each subtree
+        must fall in so ordering is verified globally
+        """
+        problems = []
+        count = 0
+        s = Stack()
+        if self.root is not None:
+            s.push((self.root, None, None))
+        while not s.is_empty():
+            node, low, high = s.pop()
+            count += node.count if self.multiset else 1
+            problems.extend(self._check_node(node))
+            if (low is not None and not low < node.value) or (high is not None and not node.value < high):
+                problems.append("node {} is outside its subtree bounds".format(node.value))
+            if node.left is not None:
+                s.push((node.left, low, node.value))
+            if node.right is not None:
+                s.push((node.right, node.value, high))
+        if self._count is not None and count != self._count:
+            problems.append("found {} values, count is {}".format(count, self._count))
+        if self.root is not None:
+            if self.min_node is not self.first_node():
+                problems.append("cached minimum is not the leftmost node")
+            if self.max_node is not self.last_node():
+                problems.append("cached maximum is not the rightmost node")
+        return problems
+
+    def raw_copy(self) -> 'AVL':
+        """
+        Returns a copy that keeps every stored height and size as is (even
+        if wrong), so it can be verified while this tree keeps changing
+        """
+        tree = self.spawn()
+        mapping = {}
+        s = Stack()
+        if self.root is not None:
+            s.push(self.root)
+        # Copy nodes parents first so each can be linked on creation
+        while not s.is_empty():
+            node = s.pop()
+            copy = tree.clone_node(node)
+            copy.height = node.height
+            if self.order_stats:
+                copy.size = node.size
+            mapping[id(node)] = copy
+            parent = mapping.get(id(node.parent)) if node.parent is not None else None
+            copy.parent = parent
+            if parent is None:
+                tree.root = copy
+            elif node.parent.left is node:
+                parent.left = copy
+            else:
+                parent.right = copy
+            if node.right is not None:
+                s.push(node.right)
+            if node.left is not None:
+                s.push(node.left)
+        tree._count = self._count
+        tree.min_node = mapping.get(id(self.min_node))
+        tree.max_node = mapping.get(id(self.max_node))
+        return tree
+
+    def verify_in_background(self, level='full'):
+        """
+        Copies the tree (O(n), on this thread) and runs find_problems(level)
+        on the copy in a background thread. Returns a Future of the list
+        """
+        snapshot = self.raw_copy()
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(snapshot.find_problems, level)
+        executor.shutdown(wait=False)
+        return future
+
+    # ----------------------------------------------------------------------
+    def get_left_height(self, node):
+        """
+        Returns height left of a node
+        """
+        # Height of nodes left child
+        return self.height(node.left)
+
+    def get_right_height(self, node):
+        """
+        Returns height right of a node
+        """
+        # Height of nodes right child
+        return self.height(node.right)
+
+    def height(self, n):
+        """
+        Returns height of given node using its stored height
+        """
+        # If node is None
+        if n is None:
+            return -1
+        # Stored heights are kept current by update_height
+        return n.height
+
+    def update_height(self, node):
+        """
+        Updates the height of a node from the stored heights of its children
+        """
+        # Children heights (-1 for missing child)
+        left = node.left.height if node.left is not None else -1
+        right = node.right.height if node.right is not None else -1
+        # Set new height
+        node.height = 1 + (left if left > right else right)
+
+    def size(self, n):
+        """
+        Returns the subtree size stored on a node (order_stats trees only)
+        """
+        # If node is None
+        if n is None:
+            return 0
+        return n.size
+
+    def update_size(self, node):
+        """
+        Updates the subtree size of a node from its children
+        """
+        left = node.left.size if node.left is not None else 0
+        right = node.right.size if node.right is not None else 0
+        node.size = (node.count if self.multiset else 1) + left + right
+
+    def update_node(self, node):
+        """
+        Updates every cached field of a node (height, and size when order
+        statistics are kept) from its children
+        """
+        self.update_height(node)
+        if self.order_stats:
+            self.update_size(node)
+
+    def replace_child(self, parent, old, new):
+        """
+        Points parent (or the root) at new in place of old
+        """
+        # Old node was the root
+        if parent is None:
+            self.root = new
+        # Old node was a left child
+        elif parent.left is old:
+            parent.left = new
+        # Old node was a right child
+        else:
+            parent.right = new
+        # New node takes over the parent link
+        if new is not None:
+            new.parent = parent
+
+    def rotate_left(self, n):
+        """
+        Rotates left about a node and returns the new subtree root
+        """
+        # Sets right child to C
+        c = n.right
+        # Cs left child becomes nodes right child
+        n.right = c.left
+        # If Cs left child exists
+        if n.right is not None:
+            # Update its parent
+            n.right.parent = n
+        # C takes nodes place under nodes parent
+        self.replace_child(n.parent, n, c)
+        # Node becomes Cs left child
+        c.left = n
+        # Nodes parent becomes C
+        n.parent = c
+        # Update n and c heights
+        self.update_node(n)
+        self.update_node(c)
+
+        return c
+
+    def rotate_right(self, n):
+        """
+        Rotates right about a node and returns the new subtree root
+        """
+        # Sets left child to C
+        c = n.left
+        # Cs right child becomes nodes left child
+        n.left = c.right
+        # If Cs right child exists
+        if n.left is not None:
+            # Update its parent
+            n.left.parent = n
+        # C takes nodes place under nodes parent
+        self.replace_child(n.parent, n, c)
+        # Node becomes Cs right child
+        c.right = n
+        # Nodes parent is C
+        n.parent = c
+        # Update n and c heights
+        self.update_node(n)
+        self.update_node(c)
+
+        return c
+
+    def balance_factor(self, n):
+        """
+        Returns balance factor of a node
+        """
+        # Right height minus left height
+        return self.get_right_height(n) - self.get_left_height(n)
+
+    def rebalance(self, n):
+        """
+        Rebalances the subtree rooted at n and returns its (possibly new) root
+        """
+        # Update height before checking balance
+        self.update_node(n)
+        balance = self.balance_factor(n)
+        # If node is LEFT heavy
+        if balance < -1:
+            # If child is RIGHT heavy double rotation needed
+            if self.balance_factor(n.left) > 0:
+                self.rotate_left(n.left)
+            # Rotate right about n
+            return self.rotate_right(n)
+        # If node is RIGHT heavy
+        if balance > 1:
+            # If child is LEFT heavy double rotation needed
+            if self.balance_factor(n.right) < 0:
+                self.rotate_right(n.right)
+            # Rotate left about n
+            return self.rotate_left(n)
+        return n
+
+    def retrace(self, node):
+        """
+        Rebalances from node up towards the root after an add or remove.
+        Stops as soon as a subtree height comes out unchanged, since no
+        ancestor above it can be affected
+        """
+        self.last_touched = node
+        while node is not None:
+            # Remember height before the change reached this node
+            old_height = node.height
+            # Rebalance and continue from the new subtree root
+            node = self.rebalance(node)
+            # Ancestors only depend on this subtree height
+            if node.height == old_height:
+                break
+            node = node.parent
+        # Subtree sizes still change on every remaining ancestor
+        if self.order_stats and node is not None:
+            self.update_sizes_upward(node.parent)
+
+    def update_sizes_upward(self, node):
+        """
+        Updates subtree sizes from node up to the root
+        """
+        while node is not None:
+            self.update_size(node)
+            node = node.parent
+
+    def add(self, value: object) -> bool:
+        """
+        Adds a new value to the tree while maintaining its AVL property.
+        Return True if the value was added, False if it was already present
+        (for keyed trees: if a value with an equal key was, which is kept).
+        Multisets count the value again and always return True
+        """
+        if self.key_of is None:
+            node, inserted = self._insert_node(value)
+        else:
+            node, inserted = self._insert_node(self.key_of(value))
+            if inserted:
+                node.data = value
+        if self.multiset and not inserted:
+            node.count += 1
+            if self._count is not None:
+                self._count += 1
+            self._flat = None
+            self.last_touched = node
+            if self.order_stats:
+                self.update_sizes_upward(node)
+            return True
+        return inserted
+
+    def find_slot(self, value):
+        """
+        Finds value or the place it belongs in a single descent. Returns
+        (node, None, None) if value is present, else (None, parent, left)
+        where left tells which side of parent it goes on (parent is None
+        for an empty tree)
+        """
+        # Set cur to the root and parent to None
+        cur_node = self.root
+        parent = None
+        left = False
+        # Traverse the tree checking < or > for new location
+        while cur_node is not None:
+            if value < cur_node.value:
+                parent = cur_node
+                left = True
+                cur_node = cur_node.left
+            elif cur_node.value < value:
+                parent = cur_node
+                left = False
+                cur_node = cur_node.right
+            else:
+                return cur_node, None, None
+        return None, parent, left
+
+    def _insert_node(self, value):
+        """
+        Finds value or its attach point in a single descent, creating a node
+        only when value is not already present. Returns (node, inserted)
+        """
+        node, parent, left = self.find_slot(value)
+        # Do not add if node value exists in tree
+        if node is not None:
+            return node, False
+
+        # Create new node only once we know it is needed
+        new_node = self.make_node(value)
+        if self._count is not None:
+            self._count += 1
+        self._flat = None
+        if self._cache is not None:
+            self._cache.pop(value, None)
+        # If tree is empty set as root
+        if parent is None:
+            self.root = new_node
+            self.min_node = self.max_node = new_node
+            self.last_touched = new_node
+            return new_node, True
+        # Attach on the side the descent ended
+        if left:
+            parent.left = new_node
+            # Left child of the minimum is the new minimum
+            if parent is self.min_node:
+                self.min_node = new_node
+        else:
+            parent.right = new_node
+            # Right child of the maximum is the new maximum
+            if parent is self.max_node:
+                self.max_node = new_node
+        # Set new nodes parent
+        new_node.parent = parent
+        # Rebalance from the parent up to the root
+        self.retrace(parent)
+        return new_node, True
+
+    def remove(self, value: object) -> bool:
+        """
+        Removes the value from the AVL tree. Return True if removed otherwise return False
+        """
+        if self.key_of is not None:
+            value = self.key_of(value)
+        if self.multiset:
+            node = self.find_node(value)
+            if node is None:
+                return False
+            # Only one occurrence goes
+            self.discard_node(node)
+            return True
+        return self._delete(value) is not None
+
+    def discard_node(self, node) -> None:
+        """
+        Removes one occurrence of the value at node, unlinking the node only
+        when it was the last one
+        """
+        if not self.multiset or node.count == 1:
+            self.remove_node(node)
+            return
+        node.count -= 1
+        if self._count is not None:
+            self._count -= 1
+        self._flat = None
+        self.last_touched = node
+        if self.order_stats:
+            self.update_sizes_upward(node)
+
+    def count(self, value) -> int:
+        """
+        Returns how many times value is in the tree (0 or 1 unless multiset)
+        """
+        node = self.find_node(self.key_for(value))
+        if node is None:
+            return 0
+        return node.count if self.multiset else 1
+
+    def prefer_rebuild(self, batch_size) -> bool:
+        """
+        Returns True if applying a batch of batch_size keys is cheaper as one
+        linear merge and rebuild than as incremental O(log n) updates
+        """
+        total = len(self) + batch_size
+        # Incremental work grows with depth, a rebuild with the tree size
+        return batch_size * total.bit_length() * self.BULK_REBUILD_FACTOR >= total
+
+    def add_many(self, values) -> int:
+        """
+        Adds every value from an iterable and returns how many were new.
+        Large batches are sorted and merged into a rebuilt tree in one pass
+        """
+        if not isinstance(values, list):
+            values = list(values)
+        # Small batch: plain inserts
+        if not self.prefer_rebuild(len(values)):
+            added = 0
+            for value in values:
+                if self.add(value):
+                    added += 1
+            return added
+        # Merge the sorted batch with the existing nodes, reusing them
+        merged = []
+        existing = self.ascending_nodes()
+        node = next(existing, None)
+        values, keys = self.sort_by_key(values)
+        for i, key in enumerate(keys):
+            # Take existing nodes that come first
+            while node is not None and node.value < key:
+                merged.append(node)
+                node = next(existing, None)
+            # Skip values already in the tree (multisets count them)
+            if node is not None and not key < node.value:
+                if self.multiset:
+                    node.count += 1
+                continue
+            # Skip duplicates within the batch
+            if merged and not merged[-1].value < key:
+                if self.multiset:
+                    merged[-1].count += 1
+                continue
+            if self.key_of is None:
+                merged.append(self.make_node(key))
+            else:
+                merged.append(self.make_keyed_node(key, values[i]))
+        # Keep the remaining existing nodes
+        while node is not None:
+            merged.append(node)
+            node = next(existing, None)
+        added = len(keys) if self.multiset else len(merged) - len(self)
+        self.load_nodes(merged)
+        return added
+
+    def remove_many(self, values) -> int:
+        """
+        Removes every value from an iterable and returns how many were found.
+        Large batches are sorted and filtered out of a rebuilt tree in one pass
+        """
+        if not isinstance(values, list):
+            values = list(values)
+        # Small batch: plain removes
+        if not self.prefer_rebuild(len(values)):
+            removed = 0
+            for value in values:
+                if self.remove(value):
+                    removed += 1
+            return removed
+        # Keep the existing nodes that are not in the sorted batch
+        kept = []
+        targets = self.sort_by_key(values)[1]
+        i = 0
+        for node in self.ascending_nodes():
+            # Advance past batch values below this node
+            while i < len(targets) and targets[i] < node.value:
+                i += 1
+            if self.multiset:
+                # Every matching batch value takes one occurrence
+                matched = 0
+                while i < len(targets) and not node.value < targets[i]:
+                    matched += 1
+                    i += 1
+                node.count -= min(matched, node.count)
+                if node.count == 0:
+                    continue
+            elif i < len(targets) and not node.value < targets[i]:
+                continue
+            kept.append(node)
+        total = len(self)
+        self.load_nodes(kept)
+        return total - len(self)
+
+    def release_extremes(self, node) -> None:
+        """
+        Moves the cached min/max pointers off a node that is about to leave
+        """
+        if node is self.min_node:
+            self.min_node = self.successor(node)
+        if node is self.max_node:
+            self.max_node = self.predecessor(node)
+
+    def reset_extremes(self) -> None:
+        """
+        Recomputes the cached min/max pointers in O(log n)
+        """
+        self.min_node = self.first_node()
+        self.max_node = self.last_node()
+
+    def unlink_node(self, node) -> None:
+        """
+        Unlinks a node with at most one child and rebalances above it
+        """
+        self.release_extremes(node)
+        self._flat = None
+        if self._cache is not None:
+            self._cache.pop(node.value, None)
+        child = node.left if node.left is not None else node.right
+        parent = node.parent
+        # Child (or nothing) takes the nodes place
+        self.replace_child(parent, node, child)
+        node.left = node.right = node.parent = None
+        if parent is not None:
+            self.retrace(parent)
+        else:
+            self.last_touched = child
+        if self._count is not None:
+            self._count -= node.count if self.multiset else 1
+
+    def first_node(self):
+        """
+        Returns the node with the smallest value, or None if empty
+        """
+        node = self.root
+        while node is not None and node.left is not None:
+            node = node.left
+        return node
+
+    def last_node(self):
+        """
+        Returns the node with the largest value, or None if empty
+        """
+        node = self.root
+        while node is not None and node.right is not None:
+            node = node.right
+        return node
+
+    def join_nodes(self, left, pivot, right):
+        """
+        Joins subtree roots left and right (every value in left < pivot <
+        every value in right) through the detached node pivot in
+        O(|height(left) - height(right)|). Returns the new subtree root
+        """
+        hl = self.height(left)
+        hr = self.height(right)
+        pivot.parent = None
+        # Left is taller: hang pivot off its right spine
+        if hl > hr + 1:
+            parent = left
+            while parent.right is not None and parent.right.height > hr + 1:
+                parent = parent.right
+            pivot.left = parent.right
+            pivot.right = right
+            parent.right = pivot
+        # Right is taller: hang pivot off its left spine
+        elif hr > hl + 1:
+            parent = right
+            while parent.left is not None and parent.left.height > hl + 1:
+                parent = parent.left
+            pivot.left = left
+            pivot.right = parent.left
+            parent.left = pivot
+        # Heights are close: pivot becomes the root
+        else:
+            parent = None
+            pivot.left = left
+            pivot.right = right
+        # Link pivot and its children
+        pivot.parent = parent
+        if pivot.left is not None:
+            pivot.left.parent = pivot
+        if pivot.right is not None:
+            pivot.right.parent = pivot
+        self.update_node(pivot)
+        if parent is None:
+            return pivot
+        # Restore balance above the attach point, then find the new root
+        self.retrace(parent)
+        while parent.parent is not None:
+            parent = parent.parent
+        return parent
+
+    def split_nodes(self, node, key):
+        """
+        Splits the subtree rooted at node around key. Returns subtree roots
+        (values < key, node holding key or None, values > key)
+        """
+        # Empty subtree
+        if node is None:
+            return None, None, None
+        left = node.left
+        right = node.right
+        # Detach node and its children
+        node.left = node.right = node.parent = None
+        if left is not None:
+            left.parent = None
+        if right is not None:
+            right.parent = None
+        # Key is on the left: node and its right subtree go right
+        if key < node.value:
+            low, match, high = self.split_nodes(left, key)
+            return low, match, self.join_nodes(high, node, right)
+        # Key is on the right: node and its left subtree go left
+        if node.value < key:
+            low, match, high = self.split_nodes(right, key)
+            return self.join_nodes(left, node, low), match, high
+        return left, node, right
+
+    def split(self, key):
+        """
+        Splits the tree into two new trees (values before key, values from
+        key on, in tree order) in O(log n) and leaves this tree empty. For
+        keyed trees key is a value
+        """
+        low, match, high = self.split_nodes(self.root, self.key_for(key))
+        # Key itself belongs to the right side
+        if self.reverse:
+            if match is not None:
+                low = self.join_nodes(low, match, None)
+            low, high = high, low
+        elif match is not None:
+            high = self.join_nodes(None, match, high)
+        left = self.spawn()
+        left.adopt_root(low)
+        right = self.spawn()
+        right.adopt_root(high)
+        self.make_empty()
+        return left, right
+
+    def same_ordering(self, other) -> bool:
+        """
+        Returns True if other stores the same kind of nodes in the same
+        order as this tree (type, node class, key, reverse and multiset)
+        """
+        return (type(other) is type(self) and other.node_class is self.node_class
+                and other.key is self.key and other.reverse == self.reverse
+                and other.multiset == self.multiset)
+
+    def join(self, other, pivot=_MISSING) -> 'AVL':
+        """
+        Appends every value of other (all after the values here in tree
+        order) to this tree in O(log n) and leaves other empty. With pivot,
+        it is added between the two. Raises ValueError if the ordering is
+        violated. Returns this tree
+        """
+        if other is self:
+            raise ValueError("cannot join a tree with itself")
+        if other.order_stats != self.order_stats or not self.same_ordering(other):
+            raise ValueError("cannot join trees with different configurations")
+        # Stored keys ascend, so a reverse tree goes above other
+        lower, upper = (other, self) if self.reverse else (self, other)
+        # Check that every key of lower is below every key of upper
+        high = lower.max_node
+        low = upper.min_node
+        pivot_value = pivot
+        if pivot is not _MISSING:
+            pivot = self.key_for(pivot)
+        if pivot is _MISSING:
+            if high is not None and low is not None and not high.value < low.value:
+                raise ValueError("values of other must all come after the values here")
+        elif (high is not None and not high.value < pivot) or (low is not None and not pivot < low.value):
+            raise ValueError("pivot must lie between the two trees")
+        count = None
+        if self._count is not None and other._count is not None:
+            count = self._count + other._count
+        # Without a pivot borrow the smallest node of upper
+        if pivot is _MISSING:
+            if low is None:
+                root = lower.root
+            else:
+                upper.unlink_node(low)
+                root = self.join_nodes(lower.root, low, upper.root)
+        else:
+            if self.key_of is None:
+                node = self.make_node(pivot)
+            else:
+                node = self.make_keyed_node(pivot, pivot_value)
+            root = self.join_nodes(lower.root, node, upper.root)
+        self.adopt_root(root)
+        if count is not None:
+            self._count = count + (0 if pivot is _MISSING else 1)
+        other.make_empty()
+        return self
+
+    def clone_node(self, node):
+        """
+        Creates a detached copy of node for this tree
+        """
+        if self.key_of is None:
+            new_node = self.make_node(node.value)
+        else:
+            new_node = self.make_keyed_node(node.value, node.data)
+        if self.multiset:
+            new_node.count = node.count
+        return new_node
+
+    def copy_nodes(self, node):
+        """
+        Copies the subtree rooted at node into new nodes for this tree and
+        returns the copied root (parent left unset)
+        """
+        if node is None:
+            return None
+        new_node = self.clone_node(node)
+        new_node.left = self.copy_nodes(node.left)
+        if new_node.left is not None:
+            new_node.left.parent = new_node
+        new_node.right = self.copy_nodes(node.right)
+        if new_node.right is not None:
+            new_node.right.parent = new_node
+        self.update_node(new_node)
+        return new_node
+
+    def copy(self) -> 'AVL':
+        """
+        Returns a structural copy of the tree in O(n) without rebalancing
+        """
+        tree = self.spawn()
+        tree.adopt_root(tree.copy_nodes(self.root))
+        return tree
+
+    def merge_nodes(self, other, operation):
+        """
+        Walks the in-order node streams of this tree and other side by side
+        and returns, in increasing order, the nodes operation keeps. A value
+        in both trees is represented by the node of this tree
+        """
+        keep_mine, keep_both, keep_theirs = _SET_OPERATIONS[operation]
+        mine = list(self.ascending_nodes())
+        theirs = list(other.ascending_nodes())
+        # Compare plain key lists rather than node attributes in the loop
+        mine_keys = [node.value for node in mine]
+        their_keys = [node.value for node in theirs]
+        kept = []
+        keep = kept.append
+        i = j = 0
+        n = len(mine)
+        m = len(theirs)
+        while i < n and j < m:
+            a = mine_keys[i]
+            b = their_keys[j]
+            if a < b:
+                if keep_mine:
+                    keep(mine[i])
+                i += 1
+            elif b < a:
+                if keep_theirs:
+                    keep(theirs[j])
+                j += 1
+            else:
+                if keep_both:
+                    keep(mine[i])
+                i += 1
+                j += 1
+        # One stream is used up so the rest of the other has no partners
+        if keep_mine:
+            kept.extend(mine[i:])
+        if keep_theirs:
+            kept.extend(theirs[j:])
+        return kept
+
+    def set_operation(self, other, operation) -> 'AVL':
+        """
+        Returns a new tree holding operation (one of 'union', 'intersection',
+        'difference' or 'symmetric_difference') applied to this tree and
+        other, built in O(n + m) from a merge of both in-order sequences.
+        Neither input is changed. Not supported for multisets. Raises
+        ValueError if other is configured differently
+        """
+        if self.multiset:
+            raise RuntimeError("set operations are not supported for multiset trees")
+        if not self.same_ordering(other):
+            raise ValueError("cannot combine trees with different configurations")
+        result = self.spawn()
+        clone = result.clone_node
+        result.load_nodes([clone(node) for node in self.merge_nodes(other, operation)])
+        return result
+
+    def union(self, other) -> 'AVL':
+        """
+        Returns a new tree with the values in either tree
+        """
+        return self.set_operation(other, 'union')
+
+    def intersection(self, other) -> 'AVL':
+        """
+        Returns a new tree with the values in both trees
+        """
+        return self.set_operation(other, 'intersection')
+
+    def difference(self, other) -> 'AVL':
+        """
+        Returns a new tree with the values in this tree but not in other
+        """
+        return self.set_operation(other, 'difference')
+
+    def symmetric_difference(self, other) -> 'AVL':
+        """
+        Returns a new tree with the values in exactly one of the trees
+        """
+        return self.set_operation(other, 'symmetric_difference')
+
+    def __or__(self, other) -> 'AVL':
+        return self.union(other)
+
+    def __and__(self, other) -> 'AVL':
+        return self.intersection(other)
+
+    def __sub__(self, other) -> 'AVL':
+        return self.difference(other)
+
+    def __xor__(self, other) -> 'AVL':
+        return self.symmetric_difference(other)
+
+    def dump(self, path) -> None:
+        """
+        Writes the values to path in the read-only binary layout served by
+        MmapAVL: a 16 byte header followed by fixed-width keys in Eytzinger
+        (BFS) order. Values must be all ints fitting in 64 bits (stored as
+        int64) or all floats and ints that float64 holds exactly (stored as
+        float64), else TypeError.
+        Not supported for keyed trees
+        """
+        self._require_plain_values()
+        values = list(self)
+        typecode = _key_typecode(values)
+        keys = array(typecode, _eytzinger_order(values))
+        byteorder = b'L' if sys.byteorder == 'little' else b'B'
+        with open(path, 'wb') as f:
+            f.write(struct.pack(_MMAP_HEADER, _MMAP_MAGIC, _MMAP_VERSION,
+                                typecode.encode(), byteorder, len(values)))
+            keys.tofile(f)
+
+    def freeze(self) -> 'FrozenAVL':
+        """
+        Returns an immutable sorted-array copy of the tree for read-mostly
+        serving. Not supported for keyed trees
+        """
+        self._require_plain_values()
+        return FrozenAVL(list(self))
+
+    @staticmethod
+    def load_mmap(path) -> 'MmapAVL':
+        """
+        Returns a read-only tree served straight from a file written by dump()
+        """
+        return MmapAVL(path)
+
+    def _delete(self, value):
+        """
+        Unlinks the node holding value and rebalances. Returns the removed
+        node, or None if value is not in the tree
+        """
+        node = self.find_node(value)
+        if node is not None:
+            self.remove_node(node)
+        return node
+
+    def remove_node(self, node) -> None:
+        """
+        Unlinks a node of this tree and rebalances above the change
+        """
+        self.release_extremes(node)
+        # Nodes with at most one child are cut out directly
+        if node.left is None or node.right is None:
+            self.unlink_node(node)
+            return
+        self._flat = None
+        if self._cache is not None:
+            self._cache.pop(node.value, None)
+        # Successor (s) is the leftmost node of the right subtree
+        s = node.right
+        while s.left is not None:
+            s = s.left
+        # If successor is the right child it keeps its right subtree
+        if s is node.right:
+            start = s
+        # Otherwise its right child takes its place and it adopts nodes right
+        else:
+            start = s.parent
+            start.left = s.right
+            if s.right is not None:
+                s.right.parent = start
+            s.right = node.right
+            s.right.parent = s
+        # Successor adopts nodes left subtree and takes its place
+        s.left = node.left
+        s.left.parent = s
+        self.replace_child(node.parent, node, s)
+        # Successor starts from the removed nodes height
+        s.height = node.height
+        node.left = node.right = node.parent = None
+        # Rebalance from the lowest changed node up to the root
+        self.retrace(start)
+        if self._count is not None:
+            self._count -= node.count if self.multiset else 1
+
+    def contains(self, value: object) -> bool:
+        """
+        Returns True if the value parameter is in the tree or False if it is not
+        """
+        if self.key_of is not None:
+            value = self.key_of(value)
+        cache = self._cache
+        if cache is None:
+            return self.find_node(value) is not None
+        try:
+            present = cache.get(value)
+        except TypeError:
+            # Unhashable values bypass the cache
+            return self.find_node(value) is not None
+        if present is not None:
+            cache.move_to_end(value)
+            self.cache_hits += 1
+            return present
+        self.cache_misses += 1
+        present = self.find_node(value) is not None
+        # Negative results are cached too
+        cache[value] = present
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return present
+
+    def __contains__(self, value) -> bool:
+        """
+        Supports the in operator
+        """
+        return self.contains(value)
+
+    # Public operations reported to on_op_complete hooks
+    INSTRUMENTED_OPERATIONS = ('add', 'remove', 'contains', 'pop_min', 'pop_max',
+                               'add_many', 'remove_many')
+
+    # Methods shadowed on the instance while stats are enabled
+    STATS_METHODS = ('find_node', 'find_slot', 'floor_node', 'ceiling_node', 'count_below',
+                     'split_nodes', 'ascending_nodes', 'descending_nodes', 'make_node',
+                     'rotate_left', 'rotate_right', 'rebalance')
+
+    def enable_stats(self, on_rotate=None, on_op_complete=None) -> AVLStats:
+        """
+        Starts counting comparisons, single and double rotations, retraced
+        nodes and node allocations, and returns the AVLStats. Counting works
+        by shadowing the hot methods on this instance only, so a tree without
+        stats runs the plain methods with no overhead at all. Comparisons are
+        counted in the descents of lookups, inserts, neighbour and range
+        queries, rank and split by wrapping the probe value, so values whose
+        __lt__ does not return NotImplemented for other types may be
+        undercounted. Pickling an instrumented tree stores it with stats
+        disabled
+        """
+        if self.stats is not None:
+            return self.stats
+        stats = AVLStats(on_rotate, on_op_complete)
+        self.stats = stats
+        cls = type(self)
+
+        def probe(value):
+            # Wrap once; recursive descents pass the wrapped probe back in
+            if value is None or type(value) is _CountedProbe:
+                return value
+            return _CountedProbe(value, stats)
+
+        def descent(method):
+            def counted(value, *args):
+                return method(self, probe(value), *args)
+            return counted
+
+        def range_descent(method):
+            def counted(lo=None, hi=None, inclusive=(True, True)):
+                return method(self, probe(lo), probe(hi), inclusive)
+            return counted
+
+        def split_nodes(node, key):
+            return cls.split_nodes(self, node, probe(key))
+
+        def make_node(value):
+            stats.allocations += 1
+            return cls.make_node(self, value)
+
+        def rotate(method, direction):
+            def rotated(n):
+                c = method(self, n)
+                for hook in stats.on_rotate:
+                    hook(direction, c)
+                return c
+            return rotated
+
+        def rebalance(n):
+            stats.retraced += 1
+            before_left = n.left
+            before_right = n.right
+            root = cls.rebalance(self, n)
+            # A double rotation lifts a grandchild to the top
+            if root is not n:
+                if root is before_left or root is before_right:
+                    stats.single_rotations += 1
+                else:
+                    stats.double_rotations += 1
+            return root
+
+        def operation(name):
+            method = getattr(cls, name)
+
+            def instrumented(*args):
+                before = stats.snapshot()
+                result = method(self, *args)
+                stats.operations[name] = stats.operations.get(name, 0) + 1
+                if stats.on_op_complete:
+                    after = stats.snapshot()
+                    counts = {field: after[field] - before[field] for field in AVLStats.FIELDS}
+                    for hook in stats.on_op_complete:
+                        hook(name, counts)
+                return result
+            return instrumented
+
+        self.find_node = descent(cls.find_node)
+        self.find_slot = descent(cls.find_slot)
+        self.floor_node = descent(cls.floor_node)
+        self.ceiling_node = descent(cls.ceiling_node)
+        self.count_below = descent(cls.count_below)
+        self.split_nodes = split_nodes
+        self.ascending_nodes = range_descent(cls.ascending_nodes)
+        self.descending_nodes = range_descent(cls.descending_nodes)
+        self.make_node = make_node
+        self.rotate_left = rotate(cls.rotate_left, 'left')
+        self.rotate_right = rotate(cls.rotate_right, 'right')
+        self.rebalance = rebalance
+        for name in self.INSTRUMENTED_OPERATIONS:
+            setattr(self, name, operation(name))
+        return stats
+
+    def disable_stats(self) -> None:
+        """
+        Stops counting and restores the plain methods
+        """
+        if self.stats is None:
+            return
+        for name in self.STATS_METHODS + self.INSTRUMENTED_OPERATIONS:
+            self.__dict__.pop(name, None)
+        self.stats = None
+
+    def __getstate__(self) -> dict:
+        """
+        Returns the state to pickle, leaving out the instance-level methods
+        installed by enable_stats() (a loaded copy has stats disabled)
+        """
+        state = dict(self.__dict__)
+        if self.stats is not None:
+            for name in self.STATS_METHODS + self.INSTRUMENTED_OPERATIONS:
+                state.pop(name, None)
+            state['stats'] = None
+        return state
+
+    def cache_info(self) -> CacheInfo:
+        """
+        Returns hit/miss counters and the size of the contains() cache
+        """
+        currsize = 0 if self._cache is None else len(self._cache)
+        return CacheInfo(self.cache_hits, self.cache_misses, self.cache_size, currsize)
+
+    def cache_clear(self) -> None:
+        """
+        Drops every cached contains() result (counters are kept)
+        """
+        if self._cache is not None:
+            self._cache.clear()
+
+    def find_node(self, value):
+        """
+        Returns the node holding value, or None if it is not in the tree
+        """
+        cur_node = self.root
+        # Traverse the tree checking < or > for value
+        while cur_node is not None:
+            if value < cur_node.value:
+                cur_node = cur_node.left
+            elif cur_node.value < value:
+                cur_node = cur_node.right
+            else:
+                return cur_node
+        return None
+
+    def inorder_traversal(self) -> Queue:
+        """
+        Perform an inorder traversal of the tree and return a Queue object that contains the values of the visited nodes, in the order they were visited. If the tree is empty, the methods should return an empty Queue
+        """
+        q = Queue()
+        # Fill from the iterative in-order generator
+        for value in self:
+            q.enqueue(value)
+        return q
+
+    def __iter__(self):
+        """
+        Lazily yields the values in tree order
+        """
+        nodes = self.ordered_nodes(backwards=False)
+        if self.multiset:
+            for node in nodes:
+                item = self.node_item(node)
+                for _ in range(node.count):
+                    yield item
+            return
+        if self.key_of is not None:
+            for node in nodes:
+                yield node.data
+            return
+        for node in nodes:
+            yield node.value
+
+    def __reversed__(self):
+        """
+        Lazily yields the values in reverse tree order
+        """
+        nodes = self.ordered_nodes(backwards=True)
+        if self.multiset:
+            for node in nodes:
+                item = self.node_item(node)
+                for _ in range(node.count):
+                    yield item
+            return
+        if self.key_of is not None:
+            for node in nodes:
+                yield node.data
+            return
+        for node in nodes:
+            yield node.value
+
+    def iter_range(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Lazily yields the values between lo and hi (None means unbounded)
+        in tree order, or backwards with reverse=True. inclusive is a (low,
+        high) pair of flags for the two bounds
+        """
+        key_of = self.key_of
+        if key_of is not None:
+            lo = None if lo is None else key_of(lo)
+            hi = None if hi is None else key_of(hi)
+        nodes = self.ordered_nodes(lo, hi, inclusive, reverse)
+        if self.multiset:
+            for node in nodes:
+                item = self.node_item(node)
+                for _ in range(node.count):
+                    yield item
+            return
+        if key_of is not None:
+            for node in nodes:
+                yield node.data
+            return
+        for node in nodes:
+            yield node.value
+
+    def scan_chunk(self, lo, hi, inclusive, limit):
+        """
+        Returns a list of at most limit values between lo and hi in tree
+        order (multisets may go over to finish a repeated value)
+        """
+        values = []
+        key_of = self.key_of
+        if key_of is not None:
+            lo = None if lo is None else key_of(lo)
+            hi = None if hi is None else key_of(hi)
+        for node in self.ordered_nodes(lo, hi, inclusive):
+            item = node.value if key_of is None else node.data
+            if self.multiset:
+                values.extend([item] * node.count)
+            else:
+                values.append(item)
+            if len(values) >= limit:
+                break
+        return values
+
+    def counts(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Lazily yields (value, count) pairs for the distinct values between
+        lo and hi (None means unbounded)
+        """
+        lo = None if lo is None else self.key_for(lo)
+        hi = None if hi is None else self.key_for(hi)
+        for node in self.ordered_nodes(lo, hi, inclusive, reverse):
+            yield self.node_item(node), node.count if self.multiset else 1
+
+    def ordered_nodes(self, lo=None, hi=None, inclusive=(True, True), backwards=False):
+        """
+        Yields the nodes between the keys lo and hi in tree order (or
+        backwards), mirroring bounds and direction for reverse trees
+        """
+        if self.reverse:
+            lo, hi = hi, lo
+            inclusive = inclusive[::-1]
+            backwards = not backwards
+        if backwards:
+            return self.descending_nodes(lo, hi, inclusive)
+        return self.ascending_nodes(lo, hi, inclusive)
+
+    def ascending_nodes(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Yields the nodes between lo and hi in ascending order using an
+        explicit stack of at most one root-to-leaf path
+        """
+        inc_lo, inc_hi = inclusive
+        s = Stack()
+        # Descend to the first node at or above lo, stacking the path
+        node = self.root
+        while node is not None:
+            value = node.value
+            # Node is below the low bound so skip it and its left subtree
+            if lo is not None and (value < lo or (not inc_lo and not lo < value)):
+                node = node.right
+            else:
+                s.push(node)
+                node = node.left
+        while not s.is_empty():
+            node = s.pop()
+            value = node.value
+            # Stop at the first node past the high bound
+            if hi is not None and (hi < value or (not inc_hi and not value < hi)):
+                return
+            yield node
+            # Next is the leftmost node of the right subtree
+            node = node.right
+            while node is not None:
+                s.push(node)
+                node = node.left
+
+    def descending_nodes(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Yields the nodes between lo and hi in descending order using an
+        explicit stack of at most one root-to-leaf path
+        """
+        inc_lo, inc_hi = inclusive
+        s = Stack()
+        # Descend to the last node at or below hi, stacking the path
+        node = self.root
+        while node is not None:
+            value = node.value
+            # Node is above the high bound so skip it and its right subtree
+            if hi is not None and (hi < value or (not inc_hi and not value < hi)):
+                node = node.left
+            else:
+                s.push(node)
+                node = node.right
+        while not s.is_empty():
+            node = s.pop()
+            value = node.value
+            # Stop at the first node past the low bound
+            if lo is not None and (value < lo or (not inc_lo and not lo < value)):
+                return
+            yield node
+            # Next is the rightmost node of the left subtree
+            node = node.left
+            while node is not None:
+                s.push(node)
+                node = node.right
+
+    def find_min(self) -> object:
+        """
+        Returns the lowest value in the tree (the first in tree order)
+        """
+        return self.node_item(self.max_node if self.reverse else self.min_node)
+
+    def find_max(self) -> object:
+        """
+        Returns the highest value in the tree (the last in tree order)
+        """
+        return self.node_item(self.min_node if self.reverse else self.max_node)
+
+    def pop_min(self) -> object:
+        """
+        Removes and returns the lowest value (the first in tree order).
+        Raises IndexError if empty
+        """
+        if self.reverse:
+            return self._pop_max_key()
+        return self._pop_min_key()
+
+    def _pop_min_key(self) -> object:
+        """
+        Removes and returns the value with the smallest stored key
+        """
+        node = self.min_node
+        if node is None:
+            raise IndexError("pop from empty tree")
+        item = self.node_item(node)
+        # Minimum has no left child so it is cut out directly
+        if self.multiset and node.count > 1:
+            self.discard_node(node)
+        else:
+            self.unlink_node(node)
+        return item
+
+    def pop_max(self) -> object:
+        """
+        Removes and returns the highest value (the last in tree order).
+        Raises IndexError if empty
+        """
+        if self.reverse:
+            return self._pop_min_key()
+        return self._pop_max_key()
+
+    def _pop_max_key(self) -> object:
+        """
+        Removes and returns the value with the largest stored key
+        """
+        node = self.max_node
+        if node is None:
+            raise IndexError("pop from empty tree")
+        item = self.node_item(node)
+        # Maximum has no right child so it is cut out directly
+        if self.multiset and node.count > 1:
+            self.discard_node(node)
+        else:
+            self.unlink_node(node)
+        return item
+
+    def successor(self, node):
+        """
+        Returns the node after node in value order, or None if it is the
+        last. Follows parent pointers, O(1) amortized over a full scan
+        """
+        # Leftmost node of the right subtree
+        if node.right is not None:
+            node = node.right
+            while node.left is not None:
+                node = node.left
+            return node
+        # First ancestor reached from its left side
+        while node.parent is not None and node.parent.right is node:
+            node = node.parent
+        return node.parent
+
+    def predecessor(self, node):
+        """
+        Returns the node before node in value order, or None if it is the
+        first. Follows parent pointers, O(1) amortized over a full scan
+        """
+        # Rightmost node of the left subtree
+        if node.left is not None:
+            node = node.left
+            while node.right is not None:
+                node = node.right
+            return node
+        # First ancestor reached from its right side
+        while node.parent is not None and node.parent.left is node:
+            node = node.parent
+        return node.parent
+
+    def floor_node(self, value, inclusive=True):
+        """
+        Returns the node with the largest value below value (or equal to it
+        when inclusive), or None
+        """
+        best = None
+        node = self.root
+        while node is not None:
+            # Node qualifies, look for a larger one on the right
+            if node.value < value or (inclusive and not value < node.value):
+                best = node
+                node = node.right
+            else:
+                node = node.left
+        return best
+
+    def ceiling_node(self, value, inclusive=True):
+        """
+        Returns the node with the smallest value above value (or equal to it
+        when inclusive), or None
+        """
+        best = None
+        node = self.root
+        while node is not None:
+            # Node qualifies, look for a smaller one on the left
+            if value < node.value or (inclusive and not node.value < value):
+                best = node
+                node = node.left
+            else:
+                node = node.right
+        return best
+
+    def floor(self, value) -> object:
+        """
+        Returns the largest value <= value (the last at or before value in
+        tree order), or None if there is none
+        """
+        # Tree order is the mirror of key order in reverse trees
+        if self.reverse:
+            return self.node_item(self.ceiling_node(self.key_for(value)))
+        return self.node_item(self.floor_node(self.key_for(value)))
+
+    def ceiling(self, value) -> object:
+        """
+        Returns the smallest value >= value, or None if there is none
+        """
+        # Tree order is the mirror of key order in reverse trees
+        if self.reverse:
+            return self.node_item(self.floor_node(self.key_for(value)))
+        return self.node_item(self.ceiling_node(self.key_for(value)))
+
+    def lower(self, value) -> object:
+        """
+        Returns the largest value < value, or None if there is none
+        """
+        # Tree order is the mirror of key order in reverse trees
+        if self.reverse:
+            return self.node_item(self.ceiling_node(self.key_for(value), False))
+        return self.node_item(self.floor_node(self.key_for(value), False))
+
+    def higher(self, value) -> object:
+        """
+        Returns the smallest value > value, or None if there is none
+        """
+        # Tree order is the mirror of key order in reverse trees
+        if self.reverse:
+            return self.node_item(self.floor_node(self.key_for(value), False))
+        return self.node_item(self.ceiling_node(self.key_for(value), False))
+
+    def nearest(self, value) -> object:
+        """
+        Returns the value closest to value (the one first in tree order on a
+        tie), or None if the tree is empty. Values (keys for keyed trees)
+        must support subtraction
+        """
+        value = self.key_for(value)
+        below = above = None
+        node = self.root
+        # One descent tracking the closest node on each side
+        while node is not None:
+            if value < node.value:
+                above = node
+                node = node.left
+            elif node.value < value:
+                below = node
+                node = node.right
+            else:
+                return self.node_item(node)
+        if below is None:
+            return self.node_item(above)
+        if above is None:
+            return self.node_item(below)
+        below_distance = value - below.value
+        above_distance = above.value - value
+        if below_distance < above_distance or (below_distance == above_distance and not self.reverse):
+            return self.node_item(below)
+        return self.node_item(above)
+
+    def sorted_values(self):
+        """
+        Returns the values (sort keys for keyed trees) in tree order as a
+        NumPy array when NumPy is installed and they are numeric scalars,
+        else as a list. The copy must not be modified
+        """
+        flat = self.sorted_keys()
+        return flat[::-1] if self.reverse else flat
+
+    def sorted_keys(self):
+        """
+        Returns the stored sort keys in ascending order, cached until the
+        next add or remove (see sorted_values)
+        """
+        if self._flat is None:
+            if self.multiset:
+                values = [node.value for node in self.ascending_nodes() for _ in range(node.count)]
+            else:
+                values = [node.value for node in self.ascending_nodes()]
+            if np is not None and values:
+                flat = _numeric_vector(values)
+                if flat is not None:
+                    values = flat
+            self._flat = values
+        return self._flat
+
+    def _vector_probes(self, values):
+        """
+        Returns (sorted snapshot, probes) as NumPy arrays when both are
+        numeric and the probes convert to the snapshot dtype exactly, else
+        None
+        """
+        flat = self.sorted_keys()
+        if np is None or not isinstance(flat, np.ndarray):
+            return None
+        if self.key_of is not None:
+            values = [self.key_of(value) for value in values]
+        probes = _numeric_vector(values)
+        if probes is None:
+            return None
+        # NumPy compares mixed dtypes in a common type, which may round
+        if probes.dtype != flat.dtype:
+            if not np.can_cast(probes.dtype, flat.dtype, 'safe'):
+                return None
+            if flat.dtype.kind == 'f' and not _within_float_precision(probes):
+                return None
+        return flat, probes
+
+    def probe_keys(self, values):
+        """
+        Returns a list of the sort keys of the probes
+        """
+        if self.key_of is None:
+            return list(values)
+        return [self.key_of(value) for value in values]
+
+    def _merge_ranks(self, values, inclusive):
+        """
+        Returns, for every probe, the number of keys below it (or at or
+        below it when inclusive), by sorting the probes and walking them
+        alongside the sorted snapshot once
+        """
+        flat = self.sorted_keys()
+        # Plain Python scalars so probes compare as they would in the tree
+        if not isinstance(flat, list):
+            flat = flat.tolist()
+        ranks = [0] * len(values)
+        i = 0
+        for position in sorted(range(len(values)), key=values.__getitem__):
+            probe = values[position]
+            # Advance past every value that counts for this probe
+            while i < len(flat) and (flat[i] < probe or (inclusive and not probe < flat[i])):
+                i += 1
+            ranks[position] = i
+        return ranks
+
+    def rank_many(self, values):
+        """
+        Returns the number of tree values before each probe in tree order,
+        as a NumPy int array for numeric keys (vectorized) or else as a list
+        """
+        if self.reverse:
+            # Values after the probe in key order come first
+            return _shift_ranks(self.key_ranks(values, True), len(self.sorted_keys()), -1)
+        return self.key_ranks(values, False)
+
+    def key_ranks(self, values, inclusive):
+        """
+        Returns, for every probe, the number of stored keys below it (or at
+        or below it when inclusive), vectorized when possible
+        """
+        vector = self._vector_probes(values)
+        if vector is not None:
+            return np.searchsorted(vector[0], vector[1], 'right' if inclusive else 'left')
+        return self._merge_ranks(self.probe_keys(values), inclusive)
+
+    def contains_many(self, values):
+        """
+        Returns whether each probe is in the tree, as a NumPy bool array for
+        numeric keys (vectorized) or else as a list
+        """
+        vector = self._vector_probes(values)
+        if vector is not None:
+            flat, probes = vector
+            if len(flat) == 0:
+                return np.zeros(probes.shape, dtype=bool)
+            index = np.searchsorted(flat, probes, 'left')
+            return (index < len(flat)) & (flat[np.minimum(index, len(flat) - 1)] == probes)
+        values = self.probe_keys(values)
+        flat = self.sorted_keys()
+        if not isinstance(flat, list):
+            flat = flat.tolist()
+        return [i < len(flat) and not value < flat[i]
+                for value, i in zip(values, self._merge_ranks(values, False))]
+
+    def floor_many(self, values):
+        """
+        Returns for each probe the position in sorted_values() of the last
+        value at or before the probe in tree order, or -1 if there is none.
+        NumPy int array for numeric keys (vectorized), else a list
+        """
+        if self.reverse:
+            # Last at or before in descending order is the first key >= probe
+            return _shift_ranks(self.key_ranks(values, False), len(self.sorted_keys()) - 1, -1)
+        return _shift_ranks(self.key_ranks(values, True), -1, 1)
+
+    def is_empty(self) -> bool:
+        """
+        Returns True if the tree is empty, otherwise the method should return False.
+        """
+        # Check if root exists
+        if self.root is None:
+            return True
+        return False
+
+
+    def make_empty(self) -> None:
+        """
+        Removes all of the nodes from the tree.
+        """
+        # Set root to None, disconnecting any children
+        if self.root is not None:
+            self.root = None
+        self._count = 0
+        self._flat = None
+        self.cache_clear()
+        self.last_touched = None
+        self.min_node = self.max_node = None
+        return None
+
+    def _require_order_stats(self):
+        """
+        Raises RuntimeError unless the tree keeps subtree sizes
+        """
+        if not self.order_stats:
+            raise RuntimeError("order statistics need AVL(order_stats=True)")
+
+    def rank(self, value) -> int:
+        """
+        Returns the number of values in the tree before value (smaller than
+        it, or larger for reverse trees)
+        """
+        self._require_order_stats()
+        if self.reverse:
+            return len(self) - self.count_below(self.key_for(value), True)
+        return self.count_below(self.key_for(value), False)
+
+    def count_below(self, value, inclusive) -> int:
+        """
+        Returns the number of values smaller than value (or equal to it when
+        inclusive) in a single descent
+        """
+        count = 0
+        node = self.root
+        while node is not None:
+            # Node and its left subtree are all counted
+            if node.value < value or (inclusive and not value < node.value):
+                count += node.size - self.size(node.right)
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def select(self, k) -> object:
+        """
+        Returns the k-th value in tree order (0-based, negative k counts from
+        the end). Raises IndexError if k is out of range
+        """
+        self._require_order_stats()
+        n = self.size(self.root)
+        if k < 0:
+            k += n
+        if not 0 <= k < n:
+            raise IndexError("select index out of range")
+        # The k-th in descending order is the (n - 1 - k)-th stored key
+        if self.reverse:
+            k = n - 1 - k
+        node = self.root
+        while True:
+            left = self.size(node.left)
+            # Left subtree and this nodes occurrences
+            upto = node.size - self.size(node.right)
+            # Target is in the left subtree
+            if k < left:
+                node = node.left
+            # Target is this node
+            elif k < upto:
+                return self.node_item(node)
+            # Skip the left subtree and this node
+            else:
+                k -= upto
+                node = node.right
+
+    def count_range(self, lo=None, hi=None, inclusive=(True, True)) -> int:
+        """
+        Returns the number of values between lo and hi (None means unbounded)
+        """
+        self._require_order_stats()
+        inc_lo, inc_hi = inclusive
+        # Bounds are in tree order, so swap them into key order
+        if self.reverse:
+            lo, hi = hi, lo
+            inc_lo, inc_hi = inc_hi, inc_lo
+        upper = len(self) if hi is None else self.count_below(self.key_for(hi), inc_hi)
+        lower = 0 if lo is None else self.count_below(self.key_for(lo), not inc_lo)
+        return max(0, upper - lower)
+
+
+# Header of dump() files: magic, version, key typecode, byte order, count
+_MMAP_HEADER = '<4sBccxQ'
+_MMAP_MAGIC = b'AVLE'
+_MMAP_VERSION = 1
+
+
+def _key_typecode(values):
+    """
+    Returns the array typecode that stores every value exactly ('q' for
+    64-bit ints, 'd' for floats). Raises TypeError for other keys
+    """
+    if all(type(value) is int for value in values):
+        if not values or (-2 ** 63 <= values[0] and values[-1] < 2 ** 63):
+            return 'q'
+    if all(type(value) in (int, float) for value in values):
+        # Ints only qualify when float64 holds them exactly
+        for value in values:
+            if type(value) is int and not _exact_float(value):
+                raise TypeError("int key {} cannot be stored exactly".format(value))
+        return 'd'
+    raise TypeError("only int or float keys can be stored in fixed width")
+
+
+def _exact_float(value):
+    """
+    Returns True if the int value converts to float without rounding
+    """
+    try:
+        return float(value) == value
+    except OverflowError:
+        return False
+
+
+def _shift_ranks(ranks, offset, sign):
+    """
+    Returns offset + sign * rank for every rank of a NumPy array or list
+    """
+    if isinstance(ranks, list):
+        return [offset + sign * rank for rank in ranks]
+    return offset + sign * ranks
+
+
+def _numeric_vector(values):
+    """
+    Returns values as a one-dimensional numeric NumPy array, or None when
+    they are not plain numbers (tuples would become a 2-D array)
+    """
+    try:
+        vector = np.asarray(values)
+    except (ValueError, OverflowError):
+        # Ragged sequences or ints beyond 64 bits cannot form an array
+        return None
+    # Only plain numeric vectors search correctly in NumPy
+    if vector.ndim != 1 or vector.dtype.kind not in 'iuf':
+        return None
+    # Ints mixed into a float array may have been rounded
+    if vector.dtype.kind == 'f' and not _within_float_precision(vector):
+        return None
+    return vector
+
+
+def _within_float_precision(vector):
+    """
+    Returns True if every element of the numeric array is strictly inside
+    +-2**53, where float64 holds every integer exactly (an int rounded to
+    float64 may land on 2**53 itself)
+    """
+    limit = 2 ** 53
+    return len(vector) == 0 or not ((vector >= limit) | (vector <= -limit)).any()
+
+
+def _eytzinger_slots(n):
+    """
+    Yields the Eytzinger slots of an n key implicit complete tree (slot k,
+    1-based, has children 2k and 2k + 1) in key order
+    """
+    k = 1
+    stack = []
+    # In-order walk of the implicit tree
+    while stack or k <= n:
+        while k <= n:
+            stack.append(k)
+            k *= 2
+        k = stack.pop()
+        yield k
+        k = 2 * k + 1
+
+
+def _eytzinger_order(values):
+    """
+    Returns sorted values rearranged into Eytzinger order
+    """
+    out = [None] * len(values)
+    for value, k in zip(values, _eytzinger_slots(len(values))):
+        out[k - 1] = value
+    return out
+
+
+class AVLMap(AVL):
+    """
+    Ordered key -> value map on the same rotation and rebalance machinery
+    as AVL. Keys are stored as node values and payloads in node.data, so
+    updating a payload never rebalances. Set operations keep the payloads
+    of the left operand
+    """
+
+    def __init__(self, items=None, order_stats=False, compact=False, cache_size=0) -> None:
+        """
+        Initialize a new map from a mapping or an iterable of (key, value)
+        pairs (if provided)
+        """
+        AVL.__init__(self, None, order_stats, compact, cache_size)
+        if compact:
+            self.node_class = CompactMapNode
+        if items is not None:
+            self.update(items)
+
+    @classmethod
+    def from_iterable(cls, items, **options) -> 'AVLMap':
+        """
+        Builds a perfectly balanced map from (key, value) pairs in any order.
+        For repeated keys the last value wins
+        """
+        tree = cls(**options)
+        latest = dict(items.items() if hasattr(items, 'items') else items)
+        tree.load_sorted(sorted(latest.items(), key=lambda item: item[0]), check=False)
+        return tree
+
+    def load_sorted(self, items, check=True) -> None:
+        """
+        Replaces the content of the map with (key, value) pairs whose keys
+        are strictly increasing, building it bottom-up in linear time
+        """
+        if not isinstance(items, list):
+            items = list(items)
+        # Reject input that would break BST ordering
+        if check:
+            for i in range(1, len(items)):
+                if not items[i - 1][0] < items[i][0]:
+                    raise ValueError("keys must be strictly increasing")
+        nodes = []
+        for key, value in items:
+            node = self.make_node(key)
+            node.data = value
+            nodes.append(node)
+        self.load_nodes(nodes)
+
+    def make_node(self, value):
+        """
+        Creates a detached node for key value with an empty payload
+        """
+        node = AVL.make_node(self, value)
+        node.data = None
+        return node
+
+    def clone_node(self, node):
+        """
+        Creates a detached copy of node and its payload for this map
+        """
+        new_node = self.make_node(node.value)
+        new_node.data = node.data
+        return new_node
+
+    def __getitem__(self, key):
+        """
+        Returns the value for key. Raises KeyError if key is not in the map
+        """
+        node = self.find_node(key)
+        if node is None:
+            raise KeyError(key)
+        return node.data
+
+    def __setitem__(self, key, value) -> None:
+        """
+        Sets the value for key, inserting key if needed
+        """
+        self._insert_node(key)[0].data = value
+
+    def __delitem__(self, key) -> None:
+        """
+        Removes key. Raises KeyError if key is not in the map
+        """
+        if not self.remove(key):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        """
+        Returns the value for key, or default if key is not in the map
+        """
+        node = self.find_node(key)
+        return default if node is None else node.data
+
+    def pop(self, key, default=_MISSING):
+        """
+        Removes key and returns its value. Returns default if key is not in
+        the map, or raises KeyError when no default is given
+        """
+        node = self._delete(key)
+        if node is None:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        return node.data
+
+    def setdefault(self, key, default=None):
+        """
+        Returns the value for key, inserting key with default if needed
+        """
+        node, inserted = self._insert_node(key)
+        if inserted:
+            node.data = default
+        return node.data
+
+    def update(self, items) -> None:
+        """
+        Sets every (key, value) pair from a mapping or iterable of pairs
+        """
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def keys(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Lazily yields the keys between lo and hi in order
+        """
+        return self.iter_range(lo, hi, inclusive, reverse)
+
+    def values(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Lazily yields the values whose keys are between lo and hi, in key order
+        """
+        for node in self._range_nodes(lo, hi, inclusive, reverse):
+            yield node.data
+
+    def items(self, lo=None, hi=None, inclusive=(True, True), reverse=False):
+        """
+        Lazily yields the (key, value) pairs whose keys are between lo and hi,
+        in key order
+        """
+        for node in self._range_nodes(lo, hi, inclusive, reverse):
+            yield node.value, node.data
+
+    def _range_nodes(self, lo, hi, inclusive, reverse):
+        """
+        Returns the node generator for a range scan in either direction
+        """
+        if reverse:
+            return self.descending_nodes(lo, hi, inclusive)
+        return self.ascending_nodes(lo, hi, inclusive)
+
+    def __str__(self) -> str:
+        """
+        Return content of the map in key order
+        """
+        pairs = ['{}: {}'.format(key, value) for key, value in self.items()]
+        return "AVLMap { " + ", ".join(pairs) + " }"
+
+
+class PersistentTreeNode:
+    """
+    Immutable AVL node used by PersistentAVL. There is no parent pointer,
+    so unchanged subtrees can be shared between versions
+    """
+
+    __slots__ = ('value', 'left', 'right', 'height', 'size')
+
+    def __init__(self, value, left=None, right=None) -> None:
+        """
+        Initialize a node over two finished subtrees
+        """
+        self.value = value
+        self.left = left
+        self.right = right
+        # Height and size follow from the children
+        left_height = left.height if left is not None else -1
+        right_height = right.height if right is not None else -1
+        self.height = 1 + (left_height if left_height > right_height else right_height)
+        self.size = 1 + (left.size if left is not None else 0) + (right.size if right is not None else 0)
+
+    def __str__(self):
+        return 'AVL Node: {}'.format(self.value)
+
+
+class AVLSnapshot:
+    """
+    Read-only view of one PersistentAVL version. Creating it is O(1) and it
+    never changes, so any number of threads can read it without locking
+    """
+
+    def __init__(self, root=None) -> None:
+        """
+        Initialize a view over a PersistentTreeNode root
+        """
+        self.root = root
+
+    # Values are compared directly, there is no key function, no counts
+    key_of = None
+    reverse = False
+    multiset = False
+
+    # Read paths only follow left/right, so they are shared with AVL
+    key_for = AVL.key_for
+    node_item = AVL.node_item
+    __str__ = AVL.__str__
+    _str_helper = AVL._str_helper
+    find_node = AVL.find_node
+    __contains__ = AVL.__contains__
+    __iter__ = AVL.__iter__
+    __reversed__ = AVL.__reversed__
+    iter_range = AVL.iter_range
+    ordered_nodes = AVL.ordered_nodes
+    ascending_nodes = AVL.ascending_nodes
+    descending_nodes = AVL.descending_nodes
+    inorder_traversal = AVL.inorder_traversal
+    first_node = AVL.first_node
+    last_node = AVL.last_node
+    floor_node = AVL.floor_node
+    ceiling_node = AVL.ceiling_node
+    floor = AVL.floor
+    ceiling = AVL.ceiling
+    lower = AVL.lower
+    higher = AVL.higher
+    nearest = AVL.nearest
+    is_empty = AVL.is_empty
+    size = AVL.size
+    count_below = AVL.count_below
+
+    def contains(self, value) -> bool:
+        """
+        Returns True if value is in this version
+        """
+        return self.find_node(value) is not None
+
+    def __len__(self) -> int:
+        """
+        Returns the number of values in this version
+        """
+        return 0 if self.root is None else self.root.size
+
+    def find_min(self) -> object:
+        """
+        Returns the lowest value, or None if empty
+        """
+        node = self.first_node()
+        return None if node is None else node.value
+
+    def find_max(self) -> object:
+        """
+        Returns the highest value, or None if empty
+        """
+        node = self.last_node()
+        return None if node is None else node.value
+
+    def rank(self, value) -> int:
+        """
+        Returns the number of values smaller than value
+        """
+        return self.count_below(value, False)
+
+
+class PersistentAVL(AVLSnapshot):
+    """
+    AVL tree with path copying: every add() or remove() builds new nodes
+    along one root-to-leaf path, shares every other subtree, and installs
+    the new root with a single assignment. snapshot() hands out the
+    current version in O(1). Writers must still be serialized by the caller
+    """
+
+    def __init__(self, start_tree=None) -> None:
+        """
+        Initialize a new persistent tree from an iterable (if provided)
+        """
+        AVLSnapshot.__init__(self)
+        if start_tree is not None:
+            for value in start_tree:
+                self.add(value)
+
+    @classmethod
+    def from_sorted(cls, values) -> 'PersistentAVL':
+        """
+        Builds a perfectly balanced tree from strictly increasing values in
+        linear time
+        """
+        if not isinstance(values, list):
+            values = list(values)
+        tree = cls()
+        tree.root = tree.build_balanced(values, 0, len(values))
+        return tree
+
+    def build_balanced(self, values, lo, hi):
+        """
+        Builds a balanced subtree from values[lo:hi] and returns its root
+        """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        return PersistentTreeNode(values[mid], self.build_balanced(values, lo, mid),
+                                  self.build_balanced(values, mid + 1, hi))
+
+    def snapshot(self) -> AVLSnapshot:
+        """
+        Returns an immutable view of the current version in O(1)
+        """
+        return AVLSnapshot(self.root)
+
+    def add(self, value) -> bool:
+        """
+        Adds value in a new version. Return True if it was not present
+        """
+        root = self.insert_path(self.root, value)
+        if root is self.root:
+            return False
+        # Readers see either the old or the new version, never a mix
+        self.root = root
+        return True
+
+    def remove(self, value) -> bool:
+        """
+        Removes value in a new version. Return True if it was present
+        """
+        root = self.delete_path(self.root, value)
+        if root is self.root:
+            return False
+        self.root = root
+        return True
+
+    def make_empty(self) -> None:
+        """
+        Installs an empty version
+        """
+        self.root = None
+
+    def insert_path(self, node, value):
+        """
+        Returns a subtree equal to node plus value, copying only the search
+        path. Returns node itself if value is already present
+        """
+        if node is None:
+            return PersistentTreeNode(value)
+        if value < node.value:
+            left = self.insert_path(node.left, value)
+            if left is node.left:
+                return node
+            return self.balanced(node.value, left, node.right)
+        if node.value < value:
+            right = self.insert_path(node.right, value)
+            if right is node.right:
+                return node
+            return self.balanced(node.value, node.left, right)
+        return node
+
+    def delete_path(self, node, value):
+        """
+        Returns a subtree equal to node minus value, copying only the search
+        path. Returns node itself if value is not present
+        """
+        if node is None:
+            return None
+        if value < node.value:
+            left = self.delete_path(node.left, value)
+            if left is node.left:
+                return node
+            return self.balanced(node.value, left, node.right)
+        if node.value < value:
+            right = self.delete_path(node.right, value)
+            if right is node.right:
+                return node
+            return self.balanced(node.value, node.left, right)
+        # Found: a missing side means the other child takes over
+        if node.left is None:
+            return node.right
+        if node.right is None:
+            return node.left
+        # Successor value moves up and is deleted from the right subtree
+        successor = node.right
+        while successor.left is not None:
+            successor = successor.left
+        right = self.delete_path(node.right, successor.value)
+        return self.balanced(successor.value, node.left, right)
+
+    def balanced(self, value, left, right):
+        """
+        Returns a new node over left and right, rotating with fresh nodes if
+        their heights differ by two
+        """
+        left_height = left.height if left is not None else -1
+        right_height = right.height if right is not None else -1
+        # LEFT heavy
+        if left_height > right_height + 1:
+            if self.height(left.left) >= self.height(left.right):
+                # Single right rotation
+                return PersistentTreeNode(left.value, left.left,
+                                          PersistentTreeNode(value, left.right, right))
+            # Double rotation through left.right
+            middle = left.right
+            return PersistentTreeNode(middle.value,
+                                      PersistentTreeNode(left.value, left.left, middle.left),
+                                      PersistentTreeNode(value, middle.right, right))
+        # RIGHT heavy
+        if right_height > left_height + 1:
+            if self.height(right.right) >= self.height(right.left):
+                # Single left rotation
+                return PersistentTreeNode(right.value,
+                                          PersistentTreeNode(value, left, right.left),
+                                          right.right)
+            # Double rotation through right.left
+            middle = right.left
+            return PersistentTreeNode(middle.value,
+                                      PersistentTreeNode(value, left, middle.left),
+                                      PersistentTreeNode(right.value, middle.right, right.right))
+        return PersistentTreeNode(value, left, right)
+
+    height = AVL.height
+
+
+class ReadWriteLock:
+    """
+    Lock allowing many readers or one writer. Waiting writers block new
+    readers so a steady read load cannot starve them
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an unlocked lock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        """
+        Takes the lock shared
+        """
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        """
+        Releases a shared hold
+        """
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0 and self._writers_waiting:
+                self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        """
+        Context manager holding the lock shared
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        """
+        Context manager holding the lock exclusively
+        """
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class ConcurrentAVL:
+    """
+    Thread-safe front end for an AVL. Lookups and scans share a
+    reader-writer lock; add() and remove() only record the request in a
+    pending buffer, which one writer at a time applies to the tree with
+    add_many()/remove_many() once batch_size requests are waiting or on
+    flush(). Lookups consult the pending buffer first, so a thread always
+    sees its own writes. Values must be hashable
+    """
+
+    def __init__(self, tree=None, batch_size=1024) -> None:
         """
-        Return content of AVL in human-readable form using pre-order traversal
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Initialize a front end over tree (a new AVL if not given). Raises
+        ValueError for multiset trees, whose repeated writes of one value
+        the pending buffer would collapse, and for trees with a contains()
+        cache, which every lookup reorders while holding only the read lock
         """
-        values = []
-        self._str_helper(self.root, values)
-        return "AVL pre-order { " + ", ".join(values) + " }"
-
-    def _str_helper(self, cur, values):
+        if tree is not None and tree.multiset:
+            raise ValueError("ConcurrentAVL does not support multiset trees")
+        if tree is not None and tree.cache_size > 0:
+            raise ValueError("ConcurrentAVL does not support trees with a contains() cache")
+        self.tree = AVL() if tree is None else tree
+        self.batch_size = batch_size
+        self._lock = ReadWriteLock()
+        # Pending writes: value -> True to add, False to remove (last wins)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def add(self, value) -> None:
         """
-        Helper method for __str__. Does pre-order traversal
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Queues value for insertion
         """
-        if cur:
-            values.append(str(cur.value))
-            self._str_helper(cur.left, values)
-            self._str_helper(cur.right, values)
+        self._queue(value, True)
 
-    def is_valid_avl(self) -> bool:
+    def remove(self, value) -> None:
         """
-        Perform pre-order traversal of the tree. Return False if there
-        are any problems with attributes of any of the nodes in the tree.
-        This is intended to be a troubleshooting 'helper' method to help
-        find any inconsistencies in the tree after the add() or remove()
-        operations. Review the code to understand what this method is
-        checking and how it determines whether the AVL tree is correct.
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Queues value for removal
         """
-        s = Stack()
-        s.push(self.root)
-        while not s.is_empty():
-            node = s.pop()
-            if node:
-                # check for correct height (relative to children)
-                l = node.left.height if node.left else -1
-                r = node.right.height if node.right else -1
-                if node.height != 1 + max(l, r):
-                    return False
-                if node.parent:
-                    # parent and child pointers are in sync
-                    if node.value < node.parent.value:
-                        check_node = node.parent.left
-                    else:
-                        check_node = node.parent.right
-                    if check_node != node:
-                        return False
-                else:
-                    # NULL parent is only allowed on the root of the tree
-                    if node != self.root:
-                        return False
-                s.push(node.right)
-                s.push(node.left)
-        return True
+        self._queue(value, False)
 
-    # ----------------------------------------------------------------------
-    def get_left_height(self, node):
+    def _queue(self, value, present) -> None:
         """
-        Returns height left of a node
+        Records a pending write and flushes once the batch is full
         """
-        # Height of nodes left child
-        return self.height(node.left)
+        with self._pending_lock:
+            self._pending[value] = present
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
 
-    def get_right_height(self, node):
+    def flush(self) -> None:
         """
-        Returns height right of a node
+        Applies every pending write to the tree as one batch. Writes of
+        values that cannot be compared with the tree are dropped and the
+        first such error is re-raised once every other write is applied
         """
-        # Height of nodes right child
-        return self.height(node.right)
-
-    def height(self, n):
+        with self._lock.write_locked():
+            # Take the buffer; new writes start a fresh one
+            with self._pending_lock:
+                pending = self._pending
+                self._pending = {}
+            if not pending:
+                return
+            try:
+                self.tree.add_many([value for value, present in pending.items() if present])
+                self.tree.remove_many([value for value, present in pending.items() if not present])
+            except Exception:
+                # A value that cannot be compared with the rest fails the
+                # whole batch, so apply one by one and only drop the bad ones
+                error = self._apply_each(pending)
+                if error is not None:
+                    raise error
+
+    def _apply_each(self, pending):
         """
-        Returns height of given node
+        Applies pending writes one value at a time (already applied ones are
+        no-ops). Returns the first error raised, after applying the rest
         """
-        # If node is None
-        if n is None:
-            return -1
-        # If both nodes children are None
-        if n.left is None and n.right is None:
-            return 0
-        # Recursive calculation to get height
-        return 1 + max(self.height(n.left), self.height(n.right))
+        error = None
+        for value, present in pending.items():
+            try:
+                if present:
+                    self.tree.add(value)
+                else:
+                    self.tree.remove(value)
+            except Exception as e:
+                if error is None:
+                    error = e
+        return error
 
-    def update_height(self, node):
+    def contains(self, value) -> bool:
         """
-        Updates the height of a node
+        Returns True if value is in the tree once pending writes apply
         """
-        # Set new height
-        node.height = self.height(node)
-
-    def rotate_left(self, n):
+        # Single dict lookups are atomic, and flush() swaps the whole dict
+        present = self._pending.get(value)
+        if present is not None:
+            return present
+        self._lock.acquire_read()
+        try:
+            present = self.tree.contains(value)
+        finally:
+            self._lock.release_read()
+        # A flush may have applied a write for value meanwhile
+        pending = self._pending.get(value)
+        return present if pending is None else pending
+
+    def __contains__(self, value) -> bool:
+        return self.contains(value)
+
+    def _read(self, method, *args):
         """
-        Rotates left about a node
+        Flushes pending writes, then calls a tree method under the read lock
         """
-        # Sets left child to C
-        c = n.right
-        # Nodes child becomes Cs left child
-        n.right = c.left
-        # If Cs left child exists
-        if n.right is not None:
-            # Cs left child becomes nodes right child
-            n.right.parent = n
-        # Cs left child in node
-        c.left = n
-        # Nodes parent becomes C
-        n.parent = c
-        # Update n and c heights
-        self.update_height(n)
-        self.update_height(c)
+        if self._pending:
+            self.flush()
+        self._lock.acquire_read()
+        try:
+            return getattr(self.tree, method)(*args)
+        finally:
+            self._lock.release_read()
 
-        return c
+    def floor(self, value) -> object:
+        return self._read('floor', value)
 
-    def rotate_right(self, n):
+    def ceiling(self, value) -> object:
+        return self._read('ceiling', value)
+
+    def lower(self, value) -> object:
+        return self._read('lower', value)
+
+    def higher(self, value) -> object:
+        return self._read('higher', value)
+
+    def find_min(self) -> object:
+        return self._read('find_min')
+
+    def find_max(self) -> object:
+        return self._read('find_max')
+
+    def __len__(self) -> int:
+        return self._read('__len__')
+
+    def __iter__(self):
+        return self.iter_range()
+
+    def iter_range(self, lo=None, hi=None, inclusive=(True, True), chunk=256):
         """
-        Rotates right about a node
+        Yields the values between lo and hi in ascending order. The read
+        lock is taken per chunk of values and never held across a yield,
+        so each chunk is consistent and writers interleave between chunks
         """
-        # Sets left child to C
-        c = n.left
-        # Nodes child becomes Cs right child
-        n.left = c.right
-        # If Cs right child exists
-        if n.left is not None:
-            # Cs right child becomes nodes left child
-            n.left.parent = n
-        # Cs right child becomes node
-        c.right = n
-        # Nodes parent is C
-        n.parent = c
-        # Update n and c heights
-        self.update_height(n)
-        self.update_height(c)
+        inc_lo, inc_hi = inclusive
+        while True:
+            if self._pending:
+                self.flush()
+            with self._lock.read_locked():
+                values = self.tree.scan_chunk(lo, hi, (inc_lo, inc_hi), chunk)
+            for value in values:
+                yield value
+            if len(values) < chunk:
+                return
+            # Resume strictly after the last value seen
+            lo = values[-1]
+            inc_lo = False
 
-        return c
 
-    def balance_factor(self, n):
+class EytzingerIndex:
+    """
+    Read-only search over keys stored in Eytzinger order: keys[k] is slot
+    k (1-based, keys[0] unused) of an implicit complete tree with children
+    2k and 2k + 1.
+    Descents move down with index arithmetic only, and in-order steps use
+    the bit patterns of k instead of parent pointers
+    """
+
+    def __init__(self, keys) -> None:
         """
-        Returns balance factor of a node
+        Initialize an index over an indexable sequence holding a placeholder
+        followed by the keys in Eytzinger order
         """
-        # Right height minus left height
-        return self.get_right_height(n) - self.get_left_height(n)
+        self._keys = keys
+        self._n = len(keys) - 1
 
-    def rebalance(self, n):
+    def __len__(self) -> int:
+        return self._n
+
+    def is_empty(self) -> bool:
+        return self._n == 0
+
+    def _bound(self, value, strict):
         """
-        Performs rebalancing at each node
-        """
-        # If root is LEFT heavy
-        # Single rotation (minimum) needed
-        if self.balance_factor(n) < -1:
-            # Find if n parent is right or left heavy
-            if n.parent is not None:
-                if n.parent.right == n:
-                    temp = "right"
-                if n.parent.left == n:
-                    temp = "left"
-            # If child is RIGHT heavy
-            # Double rotation needed
-            if self.balance_factor(n.left) > 0:
-                # Rotate subroot left
-                n.left = self.rotate_left(n.left)
-                # Update parent
-                n.left.parent = n
-            # Set temp parent to parent of n pre-rotation
-            temp_parent = n.parent
-            # Rotate right about n
-            new_subtree_root = self.rotate_right(n)
-            # Set new subtree root parent to old parent of n
-            new_subtree_root.parent = temp_parent
-            # Set n parent to the new subtree root
-            n.parent = new_subtree_root
-            # Set right of new subtree root to n
-            new_subtree_root.right = n
-            # Set ns old parents right or left to new subtree root
-            if temp_parent is not None:
-                if temp == "right":
-                    temp_parent.right = new_subtree_root
-                elif temp == "left":
-                    temp_parent.left = new_subtree_root
-            if temp_parent is None:
-                self.root = new_subtree_root
-
-        # If root is RIGHT heavy
-        # Single rotation (minimum) needed
-        elif self.balance_factor(n) > 1:
-            # Find if n parent is right or left heavy
-            if n.parent is not None:
-                if n.parent.right == n:
-                    temp = "right"
-                if n.parent.left == n:
-                    temp = "left"
-            # If subroot is LEFT heavy
-            # Double rotation needed
-            elif self.balance_factor(n.right) < 0:
-                # Rotate subroot right
-                n.right = self.rotate_right(n.right)
-                # Update parent
-                n.right.parent = n
-            # Set temp parent to parent of n pre-rotation
-            temp_parent = n.parent
-            # Rotate left about n
-            new_subtree_root = self.rotate_left(n)
-            # Set new subtree root parent to old parent of n
-            new_subtree_root.parent = temp_parent
-            # Set n parent to the new subtree root
-            n.parent = new_subtree_root
-            # Set left of new subtree root to n
-            new_subtree_root.left = n
-            # Set ns old parents right or left to new subtree root
-            if temp_parent is not None:
-                if temp == "right":
-                    temp_parent.right = new_subtree_root
-                elif temp == "left":
-                    temp_parent.left = new_subtree_root
-            if temp_parent is None:
-                self.root = new_subtree_root
+        Returns the slot of the first key >= value (> value when strict),
+        or 0 if there is none
+        """
+        keys = self._keys
+        n = self._n
+        k = 1
+        # Branch-light descent: the comparison picks the child
+        if strict:
+            while k <= n:
+                k += k + (not value < keys[k])
         else:
-            # Update height
-            self.update_height(n)
+            while k <= n:
+                k += k + (keys[k] < value)
+        # Undo the trailing right moves and the last left move
+        return k >> (~k & (k + 1)).bit_length()
 
-    def add(self, value: object) -> None:
+    def _next(self, k):
         """
-        Adds a new value to the tree while maintaining its AVL property
+        Returns the slot after k in key order, or 0
         """
-        # Create new node
-        new_node = TreeNode(value)
-        # Set cur to the root and node to None
-        cur_node = self.root
-        node = None
-        # If tree is empty set as root
-        if self.root is None:
-            self.root = new_node
-
-        if self.contains(new_node.value):
-            return
-
-        # Set Node to Cur to follow its traversal
-        else:
-            while cur_node is not None:
-                node = cur_node
+        if 2 * k + 1 <= self._n:
+            k = 2 * k + 1
+            while 2 * k <= self._n:
+                k *= 2
+            return k
+        # Climb while k is a right child, then once more
+        return k >> (~k & (k + 1)).bit_length()
+
+    def _prev(self, k):
+        """
+        Returns the slot before k in key order, or 0
+        """
+        if 2 * k <= self._n:
+            k *= 2
+            while 2 * k + 1 <= self._n:
+                k = 2 * k + 1
+            return k
+        # Climb while k is a left child, then once more
+        return k >> (k & -k).bit_length()
+
+    def _first(self):
+        """
+        Returns the slot of the smallest key, or 0 if empty
+        """
+        if self._n == 0:
+            return 0
+        k = 1
+        while 2 * k <= self._n:
+            k *= 2
+        return k
 
-                # Traverse the tree checking < or > for new location
-                if new_node.value < cur_node.value:
-                    cur_node = cur_node.left
-                else:
-                    cur_node = cur_node.right
+    def _last(self):
+        """
+        Returns the slot of the largest key, or 0 if empty
+        """
+        if self._n == 0:
+            return 0
+        k = 1
+        while 2 * k + 1 <= self._n:
+            k = 2 * k + 1
+        return k
 
-                    # Do not add if node value exists in tree
-            if new_node.value == node.value:
-                cur_node = self.root
-                return
-                # If new nodes value is less than
-            elif new_node.value < node.value:
-                # Set new node
-                node.left = new_node
-                # Set new nodes parent
-                node.left.parent = node
-                # Update heights
-                self.update_height(node)
-                self.update_height(node.left)
-
-                n = new_node
-                p = n.parent
-                # Traverse up checking each parent until None
-                while p is not None:
-                    # Set a chaser
-                    q = p
-                    # Update height
-                    self.update_height(p)
-                    # Rebalance at parent
-                    self.rebalance(p)
-                    # Move up to next parent
-                    p = p.parent
-                    # Update height of root
-                    self.update_height(self.root)
-                # Set root to chaser
-                self.root = q
-
-            # If new nodes value is greater than
-            else:
-                node.right = new_node
-                # Set new nodes parent
-                node.right.parent = node
-                # Update heights
-                self.update_height(node)
-                self.update_height(node.right)
-
-                n = node.right
-                p = n.parent
-                # Traverse up checking each parent until None
-                while p is not None:
-                    # Set a chaser
-                    q = p
-                    # Update height
-                    self.update_height(p)
-                    # Rebalance at parent
-                    self.rebalance(p)
-                    # Move up to next parent
-                    p = p.parent
-                    # Update height of root
-                    self.update_height(self.root)
-                # Set root to chaser
-                self.root = q
+    def _floor_slot(self, value, inclusive):
+        """
+        Returns the slot of the last key <= value (< value if not
+        inclusive), or 0
+        """
+        k = self._bound(value, inclusive)
+        return self._last() if k == 0 else self._prev(k)
 
-    def remove(self, value: object) -> bool:
+    def _key(self, k):
         """
-        Removes the value from the AVL tree. Return True if removed otherwise return False
+        Returns the key in slot k, or None for slot 0
         """
-        # Create node with value to remove
-        node_to_remove = TreeNode(value)
-        # Set cur to the root and node to None
-        cur_node = self.root
-        node = None
-        # If tree is one node
-        if node_to_remove.value == self.root.value and self.root.left is None and self.root.right is None:
-            self.root = None
-            return True
+        return None if k == 0 else self._keys[k]
 
-        # Set Node to Cur to follow its traversal
-        while cur_node.value != node_to_remove.value:
+    def contains(self, value) -> bool:
+        # Same descent as _bound(), inlined for the hottest query
+        keys = self._keys
+        n = self._n
+        k = 1
+        while k <= n:
+            k += k + (keys[k] < value)
+        k >>= (~k & (k + 1)).bit_length()
+        return k != 0 and not value < keys[k]
 
-            # Traverse the tree checking < or > for node to remove
-            if node_to_remove.value < cur_node.value:
-                cur_node = cur_node.left
-                if cur_node is None:
-                    return False
-            else:
-                cur_node = cur_node.right
-                if cur_node is None:
-                    return False
-                # Set node to remove, its parent, and its children
-        n = cur_node
-        p = n.parent
-        right = n.right
-        left = n.left
-
-        # If removing leaf node
-        if n.left is None and n.right is None:
-            # If larger than parent (right of parent)
-            if p.value < n.value:
-                p.right = None
-                # If smaller than parent (left of parent)
-            else:
-                p.left = None
-                # Rebalance each parent up to root
-            while p is not None:
-                self.rebalance(p)
-                self.update_height(p)
-                p = p.parent
-            return True
+    def __contains__(self, value) -> bool:
+        return self.contains(value)
 
-        # If there is no successor
-        elif right is None:
-            # If larger than parent (right of parent)
-            if p.value < n.value:
-                p.right = n.left
-                n.left.parent = p
-            # If smaller than parent (left of parent)
-            else:
-                p.left = n.left
-                n.left.parent = p
-            # Rebalance each parent up to root
-            while p is not None:
-                self.rebalance(p)
-                self.update_height(p)
-                p = p.parent
-            return True
+    def floor(self, value) -> object:
+        return self._key(self._floor_slot(value, True))
 
-            # If there is a successor
-        # Set successor (s) and its parent (sp)
-        elif right is not None:
-            node = right
-            while node is not None:
-                s = node
-                node = node.left
-            sp = s.parent
-
-            # If successor IS child of n and n is not root
-            if sp == n and p is not None:
-
-                s.parent = p
-                # If larger than parent (right of parent)
-                if p.value < s.value:
-                    p.right = s
-                # If smaller than parent (left of parent)
-                elif p.value > s.value:
-                    # Reassign children and their parents
-                    p.left = s
-                    s.parent = p
-                s.left = n.left
-                if n.left is not None:
-                    n.left.parent = s
-                s.right = n.right.right
-                if n.right.right is not None:
-                    n.right.right.parent = s
-                # Rebalance each parent up to root
-                while p is not None:
-                    self.rebalance(p)
-                    self.update_height(p)
-                    p = p.parent
-                return True
-
-            # If successor is NOT child of n
-            elif sp != n and p is not None:
-                if p is not None:
-                    # right child
-                    # Reassign children and their parents
-                    if s.right is not None:
-                        s.right.parent = sp
-                        sp.left = s.right
-                        # If larger than parent (right of parent)
-                    elif p.value < s.value:
-                        p.right = s
-                        s.parent = p
-                        sp.left = s.right
-                        if n.left is not None:
-                            n.left.parent = s
-                        s.right = n.right
-                        if n.right is not None:
-                            n.right.parent = s
-                        # Rebalance each parent up to root
-                        p = sp
-                        while p is not None:
-                            self.rebalance(p)
-                            self.update_height(p)
-                            p = p.parent
-                        return True
-                    # If smaller than parent (left of parent)
-                    elif p.value > s.value:
-                        # Reassign children and their parents
-                        p.left = s
-                        s.parent = p
-                        sp.left = s.right
-                        if s.right is not None:
-                            s.right.parent = sp
-                        s.left = n.left
-                        if n.left is not None:
-                            n.left.parent = s
-                        s.right = n.right
-                        if n.right is not None:
-                            n.right.parent = s
-                        # Rebalance each parent up to root
-                        p = sp
-                        while p is not None:
-                            self.rebalance(p)
-                            self.update_height(p)
-                            p = p.parent
-                        return True
-
-                    # left child
-                    elif p is None:
-                        # Reassign children and their parents
-                        p.left = s
-                        s.parent = p
-                        if n.right is not None:
-                            n.right.parent = s
-                        s.right = n.right
-                    # Rebalance each parent up to root
-                    p = sp
-                    while p is not None:
-                        self.rebalance(p)
-                        self.update_height(p)
-                        p = p.parent
-                    return True
-
-        # If removing the root
-        if self.root.value == node_to_remove.value:
-            # Set successor (s) and its parent (sp)
-            node = right
-            while node is not None:
-                s = node
-                node = node.left
+    def lower(self, value) -> object:
+        return self._key(self._floor_slot(value, False))
 
-            sp = s.parent
-            # If successor is child of n
-            if sp == n:
-                # Reassign children and their parents
-                s.parent = p
-                s.left = n.left
-                if n.left is not None:
-                    n.left.parent = s
-                self.root = s
-                # Rebalance each parent up to root
-                p = s
-                while p is not None:
-                    self.rebalance(p)
-                    self.update_height(p)
-                    p = p.parent
-                return True
-            # Check successors children and reassign
-            if s.right is not None:
-                s.right.parent = sp
-                sp.left = s.right
-            else:
-                sp.left = None
-            # Reassign children and their parents
-            s.left = n.left
-            if n.left is not None:
-                n.left.parent = s
-            s.right = n.right
-            n.right.parent = s
-            s.parent = None
-            self.root = s
-            # Rebalance each parent up to the root
-            p = sp
-            while p is not None:
-                self.rebalance(p)
-                self.update_height(p)
-                p = p.parent
-            return True
+    def ceiling(self, value) -> object:
+        return self._key(self._bound(value, False))
 
-        return False
+    def higher(self, value) -> object:
+        return self._key(self._bound(value, True))
 
-    def contains(self, value: object) -> bool:
+    def find_min(self) -> object:
+        return self._key(self._first())
+
+    def find_max(self) -> object:
+        return self._key(self._last())
+
+    def __iter__(self):
+        return self.iter_range()
+
+    def iter_range(self, lo=None, hi=None, inclusive=(True, True)):
         """
-        Returns True if the value parameter is in the tree or False if it is not
+        Lazily yields the keys between lo and hi (None means unbounded)
         """
-        # Create new node
-        new_node = TreeNode(value)
-        cur_node = self.root
-        # If empty tree
-        if self.root is None:
-            return False
-            # If root is value
-        elif new_node.value == self.root.value:
-            return True
-        else:
-            # Traverse the tree checking < or > for value
-            while cur_node.value != new_node.value:
+        inc_lo, inc_hi = inclusive
+        keys = self._keys
+        k = self._first() if lo is None else self._bound(lo, not inc_lo)
+        while k != 0:
+            value = keys[k]
+            # Stop at the first key past the high bound
+            if hi is not None and (hi < value or (not inc_hi and not value < hi)):
+                return
+            yield value
+            k = self._next(k)
 
-                if new_node.value < cur_node.value:
 
-                    cur_node = cur_node.left
-                    if cur_node is None:
-                        return False
+class FrozenAVL:
+    """
+    Immutable search structure built by AVL.freeze(). Keys of any ordered
+    type sit in one sorted list searched with bisect, so a lookup is a
+    binary search in C over contiguous references instead of a Python loop
+    chasing node pointers, and a key's index is its rank. (The Eytzinger
+    layout is kept for MmapAVL, where keys are fixed-width and read in
+    place; over a Python list its interpreted descent loses to bisect.)
+    """
 
-                elif new_node.value > cur_node.value:
-                    cur_node = cur_node.right
-                    if cur_node is None:
-                        return False
+    def __init__(self, values) -> None:
+        """
+        Initialize from strictly increasing values
+        """
+        self._keys = list(values)
 
-            return True
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def is_empty(self) -> bool:
+        return not self._keys
 
-    def inorder_helper(self, root, q):
+    def _key(self, i):
         """
-        Recursive helper for inorder_traversal
+        Returns the key at index i, or None if i is out of range
         """
-        if root is None:
-            return q
+        return self._keys[i] if 0 <= i < len(self._keys) else None
 
-        self.inorder_helper(root.left, q)
-        q.enqueue(root.value)
-        self.inorder_helper(root.right, q)
+    def contains(self, value) -> bool:
+        keys = self._keys
+        i = bisect_left(keys, value)
+        return i != len(keys) and not value < keys[i]
 
-        return q
+    def __contains__(self, value) -> bool:
+        return self.contains(value)
 
-    def inorder_traversal(self) -> Queue:
+    def floor(self, value) -> object:
+        return self._key(bisect_right(self._keys, value) - 1)
+
+    def lower(self, value) -> object:
+        return self._key(bisect_left(self._keys, value) - 1)
+
+    def ceiling(self, value) -> object:
+        return self._key(bisect_left(self._keys, value))
+
+    def higher(self, value) -> object:
+        return self._key(bisect_right(self._keys, value))
+
+    def find_min(self) -> object:
+        return self._key(0)
+
+    def find_max(self) -> object:
+        return self._key(len(self._keys) - 1)
+
+    def rank(self, value) -> int:
         """
-        Perform an inorder traversal of the tree and return a Queue object that contains the values of the visited nodes, in the order they were visited. If the tree is empty, the methods should return an empty Queue
+        Returns the number of keys smaller than value
         """
-        q = Queue()
-        # Call recursive helper function
-        return self.inorder_helper(self.root, q)
+        return bisect_left(self._keys, value)
 
-    def find_min(self) -> object:
+    def _span(self, lo, hi, inclusive):
         """
-        Returns the lowest value in the tree
+        Returns the index range [start, stop) of the keys between lo and hi
+        (None means unbounded)
         """
-        # Set root to cur
-        cur_node = self.root
-        # If empty tree
-        if self.root is None:
-            return None
-        # Traverse to extreme left
-        while cur_node is not None:
-            node = cur_node
-            cur_node = cur_node.left
+        inc_lo, inc_hi = inclusive
+        keys = self._keys
+        start = 0
+        if lo is not None:
+            start = bisect_left(keys, lo) if inc_lo else bisect_right(keys, lo)
+        stop = len(keys)
+        if hi is not None:
+            stop = bisect_right(keys, hi) if inc_hi else bisect_left(keys, hi)
+        return start, stop
+
+    def count_range(self, lo=None, hi=None, inclusive=(True, True)) -> int:
+        """
+        Returns the number of keys between lo and hi (None means unbounded)
+        """
+        start, stop = self._span(lo, hi, inclusive)
+        return max(0, stop - start)
 
-        return node.value
+    def __iter__(self):
+        return iter(self._keys)
 
-    def find_max(self) -> object:
+    def iter_range(self, lo=None, hi=None, inclusive=(True, True)):
         """
-        Returns the highest value in the tree
+        Lazily yields the keys between lo and hi (None means unbounded)
         """
-        # Set root to cur
-        cur_node = self.root
-        # If empty tree
-        if self.root is None:
-            return None
-        # Traverse to extreme right
-        while cur_node is not None:
-            node = cur_node
-            cur_node = cur_node.right
+        keys = self._keys
+        start, stop = self._span(lo, hi, inclusive)
+        for i in range(start, stop):
+            yield keys[i]
 
-        return node.value
 
-    def is_empty(self) -> bool:
+class MmapAVL(EytzingerIndex):
+    """
+    Read-only tree over a file written by AVL.dump(). Keys are read in
+    place from a shared mmap, so opening is O(1) and processes mapping the
+    same file share one copy in the page cache
+    """
+
+    def __init__(self, path) -> None:
         """
-        Returns True if the tree is empty, otherwise the method should return False.
+        Maps the file at path. Raises ValueError if it is not a complete
+        dump() file for this machine's byte order
         """
-        # Check if root exists
-        if self.root is None:
-            return True
-        return False
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = struct.calcsize(_MMAP_HEADER)
+        if len(self._map) < header_size:
+            self._map.close()
+            raise ValueError("not an AVL dump file")
+        magic, version, typecode, byteorder, count = struct.unpack_from(_MMAP_HEADER, self._map)
+        native = b'L' if sys.byteorder == 'little' else b'B'
+        if magic != _MMAP_MAGIC or version != _MMAP_VERSION or byteorder != native:
+            self._map.close()
+            raise ValueError("not an AVL dump file for this machine")
+        # A truncated or padded file would misplace or cut off keys
+        if typecode not in (b'q', b'd') or len(self._map) != header_size + 8 * count:
+            self._map.close()
+            raise ValueError("AVL dump file is corrupt or truncated")
+        # Start one slot early so slot k is index k; the placeholder is the
+        # tail of the header and is never read
+        start = header_size - 8
+        self._view = memoryview(self._map)[start:header_size + 8 * count].cast(typecode.decode())
+        EytzingerIndex.__init__(self, self._view)
+
+    def close(self) -> None:
+        """
+        Releases the mapping
+        """
+        self._keys = (None,)
+        self._n = 0
+        self._view.release()
+        self._map.close()
 
+    def __enter__(self) -> 'MmapAVL':
+        return self
 
-    def make_empty(self) -> None:
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class AsyncAVL:
+    """
+    asyncio facade for an AVL. Calls made while a batch is running are
+    queued and coalesced into the next batch, which runs in an executor
+    thread so rebalancing and bulk loads never block the event loop. Only
+    one batch runs at a time, so the tree is never touched concurrently
+    """
+
+    def __init__(self, tree=None, executor=None, batch_size=1024) -> None:
         """
-        Removes all of the nodes from the tree.
+        Initialize a facade over tree (a new AVL if not given). executor
+        defaults to the event loop's default executor
         """
-        # Set root to None, disconnecting any children
-        if self.root is not None:
-            self.root = None
-        return None
+        self.tree = AVL() if tree is None else tree
+        self.executor = executor
+        self.batch_size = batch_size
+        # Queued (method name, args, future) requests
+        self._queue = []
+        self._drainer = None
+
+    async def _submit(self, method, *args):
+        """
+        Queues a tree method call and waits for its batch to finish
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((method, args, future))
+        if self._drainer is None:
+            self._drainer = loop.create_task(self._drain())
+        return await future
+
+    async def _drain(self) -> None:
+        """
+        Runs queued requests batch by batch until the queue is empty
+        """
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while self._queue:
+                # Let callers scheduled in the same loop pass join the batch
+                await asyncio.sleep(0)
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+                results = await loop.run_in_executor(self.executor, self._apply, batch)
+                for (method, args, future), (ok, result) in zip(batch, results):
+                    # Caller may have been cancelled meanwhile
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+                batch = []
+        except asyncio.CancelledError:
+            self._fail(batch, None)
+            raise
+        except Exception as error:
+            # Callers get the error, so the task itself ends quietly
+            self._fail(batch, error)
+        finally:
+            self._drainer = None
+
+    def _fail(self, batch, error) -> None:
+        """
+        Resolves the futures of batch and of every queued request with error
+        (or cancels them when error is None) and empties the queue
+        """
+        pending = batch + self._queue
+        self._queue = []
+        for method, args, future in pending:
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    def _apply(self, batch):
+        """
+        Executor side: runs every request of a batch in order and returns
+        (succeeded, result or exception) pairs
+        """
+        results = []
+        for method, args, future in batch:
+            try:
+                results.append((True, getattr(self.tree, method)(*args)))
+            except Exception as error:
+                results.append((False, error))
+        return results
+
+    async def add(self, value) -> bool:
+        return await self._submit('add', value)
 
+    async def remove(self, value) -> bool:
+        return await self._submit('remove', value)
 
+    async def contains(self, value) -> bool:
+        return await self._submit('contains', value)
+
+    async def add_many(self, values) -> int:
+        return await self._submit('add_many', list(values))
+
+    async def remove_many(self, values) -> int:
+        return await self._submit('remove_many', list(values))
+
+    async def floor(self, value) -> object:
+        return await self._submit('floor', value)
+
+    async def ceiling(self, value) -> object:
+        return await self._submit('ceiling', value)
+
+    async def length(self) -> int:
+        return await self._submit('__len__')
+
+    def __aiter__(self):
+        return self.iter_range()
+
+    async def iter_range(self, lo=None, hi=None, inclusive=(True, True), chunk=256):
+        """
+        Asynchronously yields the values between lo and hi in ascending
+        order, fetching chunk values per batch so the loop gets control
+        back between chunks
+        """
+        inc_lo, inc_hi = inclusive
+        while True:
+            values = await self._submit('scan_chunk', lo, hi, (inc_lo, inc_hi), chunk)
+            for value in values:
+                yield value
+            if len(values) < chunk:
+                return
+            # Resume strictly after the last value seen
+            lo = values[-1]
+            inc_lo = False
 
 
 # ------------------- BASIC TESTING -----------------------------------------
@@ -818,6 +3610,102 @@ if __name__ == '__main__':
         if not avl.is_valid_avl():
             raise Exception("PROBLEM WITH REMOVE OPERATION")
     print('remove() stress test finished')
+    print("\nPersistentAVL snapshot iteration")
+    print("--------------------------------")
+    for _ in range(20):
+        case = list(set(random.randrange(1, 2000) for _ in range(300)))
+        p = PersistentAVL(case)
+        snap = p.snapshot()
+        for value in case[::2]:
+            p.remove(value)
+        expected = sorted(case)
+        if (list(snap) != expected or list(reversed(snap)) != expected[::-1]
+                or list(snap.iter_range(500, 1500)) != [v for v in expected if 500 <= v <= 1500]
+                or list(p) != sorted(case[1::2])):
+            raise Exception("PROBLEM WITH SNAPSHOT ITERATION")
+    print('snapshot iteration test finished')
+    print("\nsplit() and join() stress test")
+    print("------------------------------")
+    for _ in range(100):
+        case = list(set(random.randrange(1, 2000) for _ in range(300)))
+        avl = AVL(case, order_stats=random.random() < 0.5)
+        key = random.randrange(1, 2000)
+        left, right = avl.split(key)
+        if (not left.is_valid_avl() or not right.is_valid_avl()
+                or not left.verify() or not right.verify()
+                or list(left) != sorted(v for v in case if v < key)
+                or list(right) != sorted(v for v in case if v >= key)):
+            raise Exception("PROBLEM WITH SPLIT OPERATION")
+        # Join without a pivot restores the original tree
+        left.join(right)
+        if not left.is_valid_avl() or not left.verify() or list(left) != sorted(case) or right:
+            raise Exception("PROBLEM WITH JOIN OPERATION")
+        # Split again and join back through the split key as pivot
+        pivot = random.randrange(1, 2000)
+        left, right = left.split(pivot)
+        right.remove(pivot)
+        left.join(right, pivot)
+        if (not left.is_valid_avl() or not left.verify()
+                or list(left) != sorted(set(case) | {pivot}) or len(left) != len(set(case) | {pivot})):
+            raise Exception("PROBLEM WITH JOIN OPERATION")
+    print('split() and join() stress test finished')
+    print("\nset operations stress test")
+    print("--------------------------")
+    for _ in range(100):
+        first = set(random.randrange(1, 500) for _ in range(200))
+        second = set(random.randrange(1, 500) for _ in range(200))
+        avl = AVL(first)
+        other = AVL.from_iterable(second)
+        for result, expected in ((avl | other, first | second), (avl & other, first & second),
+                                 (avl - other, first - second), (avl ^ other, first ^ second)):
+            if not result.is_valid_avl() or not result.verify() or list(result) != sorted(expected):
+                raise Exception("PROBLEM WITH SET OPERATIONS")
+        # Operands are left untouched
+        if list(avl) != sorted(first) or list(other) != sorted(second):
+            raise Exception("PROBLEM WITH SET OPERATIONS")
+    print('set operations stress test finished')
+    print("\nadd_many() and remove_many() stress test")
+    print("----------------------------------------")
+    for _ in range(100):
+        case = set(random.randrange(1, 5000) for _ in range(500))
+        avl = AVL(case, order_stats=random.random() < 0.5)
+        # A handful of keys takes the incremental path, thousands the rebuild
+        for size in (5, 2000):
+            batch = [random.randrange(1, 5000) for _ in range(size)]
+            added = avl.add_many(batch)
+            if added != len(set(batch) - case):
+                raise Exception("PROBLEM WITH ADD_MANY OPERATION")
+            case |= set(batch)
+            if not avl.is_valid_avl() or not avl.verify() or list(avl) != sorted(case):
+                raise Exception("PROBLEM WITH ADD_MANY OPERATION")
+            batch = [random.randrange(1, 5000) for _ in range(size)]
+            removed = avl.remove_many(batch)
+            if removed != len(set(batch) & case):
+                raise Exception("PROBLEM WITH REMOVE_MANY OPERATION")
+            case -= set(batch)
+            if not avl.is_valid_avl() or not avl.verify() or list(avl) != sorted(case):
+                raise Exception("PROBLEM WITH REMOVE_MANY OPERATION")
+    print('add_many() and remove_many() stress test finished')
+    print("\ndump() and load_mmap() round trip")
+    print("---------------------------------")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tree.avl')
+        for i in range(20):
+            # Alternate the int64 and float64 layouts
+            if i % 2:
+                case = set(random.uniform(-1e6, 1e6) for _ in range(500))
+            else:
+                case = set(random.randrange(-2 ** 62, 2 ** 62) for _ in range(500))
+            avl = AVL(case)
+            avl.dump(path)
+            with AVL.load_mmap(path) as mapped:
+                probes = [random.choice(list(case)) for _ in range(50)] + [random.uniform(-2e6, 2e6)]
+                if (len(mapped) != len(case) or list(mapped) != sorted(case)
+                        or any(not mapped.contains(value) for value in case)
+                        or any(mapped.floor(value) != avl.floor(value)
+                               or mapped.higher(value) != avl.higher(value) for value in probes)):
+                    raise Exception("PROBLEM WITH DUMP/LOAD_MMAP ROUND TRIP")
+    print('dump() and load_mmap() round trip finished')
     """print("\nPDF - method contains() example 1")
     print("---------------------------------")
     tree = AVL([10, 5, 15])
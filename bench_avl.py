@@ -0,0 +1,272 @@
+# Description: Benchmarks for the AVL tree implementation
+#
+# Usage:
+#   python bench_avl.py ops [--sizes 1000 10000 ...] [--streams random ...]
+#                           [--memory] [--seed N] [--json results.json]
+#   python bench_avl.py contention [--ops N]
+import argparse
+import bisect
+import itertools
+import json
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from avl import AVL, ConcurrentAVL
+
+
+# ------------------- KEY STREAMS -------------------------------------------
+def stream_sequential(n, rng):
+    """ Ascending keys 0..n-1 (sorted input) """
+    return list(range(n))
+
+
+def stream_reverse(n, rng):
+    """ Descending keys n-1..0 (reverse sorted input) """
+    return list(range(n - 1, -1, -1))
+
+
+def stream_random(n, rng):
+    """ Random permutation of 0..n-1 """
+    keys = list(range(n))
+    rng.shuffle(keys)
+    return keys
+
+
+def stream_zipfian(n, rng, s=1.1):
+    """ n draws from 0..n-1 with Zipf(s) popularity, so keys repeat """
+    cumulative = list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+    total = cumulative[-1]
+    # Random ranks so popular keys are spread over the key space
+    ranks = list(range(n))
+    rng.shuffle(ranks)
+    return [ranks[bisect.bisect_left(cumulative, rng.random() * total)] for _ in range(n)]
+
+
+def stream_sawtooth(n, rng):
+    """ Alternating lowest and highest remaining keys: 0, n-1, 1, n-2, ... """
+    keys = []
+    lo, hi = 0, n - 1
+    while lo <= hi:
+        keys.append(lo)
+        if lo != hi:
+            keys.append(hi)
+        lo += 1
+        hi -= 1
+    return keys
+
+
+STREAMS = {
+    'sequential': stream_sequential,
+    'reverse': stream_reverse,
+    'random': stream_random,
+    'zipfian': stream_zipfian,
+    'sawtooth': stream_sawtooth,
+}
+
+
+# ------------------- OPERATION BENCHMARKS ----------------------------------
+def timed(fn):
+    """ Returns (result, elapsed seconds) of fn() """
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def rate(count, seconds):
+    """ Operations per second, guarding against zero timings """
+    return count / seconds if seconds > 0 else float('inf')
+
+
+def peak_memory(fn):
+    """ Returns the peak traced allocation in bytes while running fn() """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream(keys, measure_memory=False):
+    """
+    Times every operation against one key stream and returns a dict of
+    ops/sec figures (plus peak bytes when measure_memory is set)
+    """
+    n = len(keys)
+    result = {'keys': n}
+
+    # Bulk construction from the unsorted stream
+    _, seconds = timed(lambda: AVL.from_iterable(keys))
+    result['bulk_build_keys_per_sec'] = rate(n, seconds)
+
+    # Incremental inserts in stream order
+    tree = AVL()
+    add = tree.add
+    _, seconds = timed(lambda: [add(key) for key in keys])
+    result['add_ops_per_sec'] = rate(n, seconds)
+    result['distinct_keys'] = len(tree)
+    result['height'] = tree.height(tree.root)
+
+    # Lookups: every stream key is a hit, shifted keys are misses
+    contains = tree.contains
+    _, seconds = timed(lambda: [contains(key) for key in keys])
+    result['contains_hit_ops_per_sec'] = rate(n, seconds)
+    _, seconds = timed(lambda: [contains(key + 0.5) for key in keys])
+    result['contains_miss_ops_per_sec'] = rate(n, seconds)
+
+    # Extremes
+    calls = min(n, 100000)
+    _, seconds = timed(lambda: [tree.find_min() for _ in range(calls)])
+    result['find_min_ops_per_sec'] = rate(calls, seconds)
+    _, seconds = timed(lambda: [tree.find_max() for _ in range(calls)])
+    result['find_max_ops_per_sec'] = rate(calls, seconds)
+
+    # Full traversal (Queue construction only; draining it is O(n^2))
+    _, seconds = timed(tree.inorder_traversal)
+    result['inorder_traversal_keys_per_sec'] = rate(len(tree), seconds)
+    _, seconds = timed(lambda: sum(1 for _ in tree))
+    result['iter_keys_per_sec'] = rate(len(tree), seconds)
+
+    # Removes in stream order
+    remove = tree.remove
+    _, seconds = timed(lambda: [remove(key) for key in keys])
+    result['remove_ops_per_sec'] = rate(n, seconds)
+
+    if measure_memory:
+        result['peak_bytes_add'] = peak_memory(lambda: AVL(keys))
+        result['peak_bytes_bulk_build'] = peak_memory(lambda: AVL.from_iterable(keys))
+        result['peak_bytes_per_key_add'] = result['peak_bytes_add'] / max(1, result['distinct_keys'])
+    return result
+
+
+def bench_ops(sizes, streams, seed=0, measure_memory=False):
+    """
+    Runs bench_stream over every size and stream, printing a row for each,
+    and returns the list of result dicts
+    """
+    results = []
+    columns = ('add_ops_per_sec', 'remove_ops_per_sec', 'contains_hit_ops_per_sec',
+               'bulk_build_keys_per_sec', 'inorder_traversal_keys_per_sec')
+    print("{:>9} {:>10} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        'keys', 'stream', 'add/s', 'remove/s', 'contains/s', 'bulk keys/s', 'inorder/s'))
+    for n in sizes:
+        for name in streams:
+            keys = STREAMS[name](n, random.Random(seed))
+            row = bench_stream(keys, measure_memory)
+            row['stream'] = name
+            results.append(row)
+            print("{:>9} {:>10} ".format(n, name) + " ".join(
+                "{:>12.0f}".format(row[column]) for column in columns))
+    return results
+
+
+# ------------------- CONTENTION BENCHMARK ----------------------------------
+class LockedAVL:
+    """
+    Baseline front end: every call goes through one global mutex
+    """
+
+    def __init__(self) -> None:
+        self.tree = AVL()
+        self._lock = threading.Lock()
+
+    def add(self, value) -> None:
+        with self._lock:
+            self.tree.add(value)
+
+    def contains(self, value) -> bool:
+        with self._lock:
+            return self.tree.contains(value)
+
+    def flush(self) -> None:
+        pass
+
+
+def run_contention(front, threads, ops_per_thread, key_space, write_ratio, seed=0):
+    """
+    Runs ops_per_thread mixed contains/add calls on every thread against
+    front and returns the total operations per second
+    """
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(worker_seed):
+        r = random.Random(worker_seed)
+        keys = [r.randrange(key_space) for _ in range(ops_per_thread)]
+        writes = [r.random() < write_ratio for _ in range(ops_per_thread)]
+        start_barrier.wait()
+        for key, write in zip(keys, writes):
+            if write:
+                front.add(key)
+            else:
+                front.contains(key)
+
+    workers = [threading.Thread(target=worker, args=(seed + i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    front.flush()
+    elapsed = time.perf_counter() - start
+    return threads * ops_per_thread / elapsed
+
+
+def bench_contention(thread_counts=(1, 4, 16), ops_per_thread=20000, key_space=10 ** 6,
+                     write_ratio=0.1, preload=10 ** 5):
+    """
+    Prints throughput of ConcurrentAVL against a single-mutex AVL at each
+    thread count and returns the rows
+    """
+    rows = []
+    print("threads  mutex ops/s  concurrent ops/s")
+    for threads in thread_counts:
+        results = []
+        for make in (LockedAVL, ConcurrentAVL):
+            front = make()
+            front.tree.add_many(random.Random(1).sample(range(key_space), preload))
+            results.append(run_contention(front, threads, ops_per_thread, key_space, write_ratio))
+        rows.append({'threads': threads, 'mutex_ops_per_sec': results[0],
+                     'concurrent_ops_per_sec': results[1]})
+        print("{:7d}  {:11.0f}  {:16.0f}".format(threads, results[0], results[1]))
+    return rows
+
+
+# ------------------- COMMAND LINE ------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AVL tree benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ops = commands.add_parser('ops', help="per-operation throughput over key streams")
+    ops.add_argument('--sizes', type=int, nargs='+', default=[10 ** 3, 10 ** 4, 10 ** 5])
+    ops.add_argument('--streams', nargs='+', choices=sorted(STREAMS), default=sorted(STREAMS))
+    ops.add_argument('--memory', action='store_true', help="also measure peak memory (slow)")
+    ops.add_argument('--seed', type=int, default=0)
+    ops.add_argument('--json', help="write results to this JSON file")
+    contention = commands.add_parser('contention', help="ConcurrentAVL vs one mutex")
+    contention.add_argument('--ops', type=int, default=20000, help="operations per thread")
+    contention.add_argument('--json', help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'ops':
+        results = bench_ops(args.sizes, args.streams, args.seed, args.memory)
+    else:
+        results = bench_contention(ops_per_thread=args.ops)
+    if args.json:
+        report = {
+            'command': args.command,
+            'arguments': vars(args),
+            'python': sys.version,
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()